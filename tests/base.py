@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+from zmq.tests import BaseZMQTestCase
+
+from uzmq import ZMQ
+
+
+class HandleTestCase(BaseZMQTestCase):
+    """ test case closing the handles it collected in ``self.handles``
+    before the sockets are closed. """
+
+    def setUp(self):
+        super(HandleTestCase, self).setUp()
+        self.handles = []
+
+    def tearDown(self):
+        # close the handles before their sockets, so their fd can't be
+        # reused while they are still open.
+        for handle in self.handles:
+            if not handle.closed:
+                handle.close()
+        super(HandleTestCase, self).tearDown()
+
+    def _zmq(self, loop, socket, **kwargs):
+        handle = ZMQ(loop, socket, **kwargs)
+        self.handles.append(handle)
+        return handle
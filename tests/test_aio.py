@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+import asyncio
+
+import zmq
+from zmq.tests import BaseZMQTestCase
+
+from uzmq.aio import AsyncZMQ
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class TestAsyncZMQ(BaseZMQTestCase):
+
+    def test_echo(self):
+        req, rep = self.create_bound_pair(zmq.REQ, zmq.REP)
+
+        async def main():
+            s = AsyncZMQ(rep)
+            s1 = AsyncZMQ(req)
+
+            async def server():
+                msg = await s.recv_multipart()
+                await s.send_multipart(msg)
+
+            task = asyncio.ensure_future(server())
+            await s1.send_multipart([u'echo'])
+            msg = await s1.recv_multipart()
+            await task
+
+            s.close()
+            s1.close()
+            return msg
+
+        assert run(main()) == [b'echo']
+
+    def test_iter(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+
+        async def main():
+            s = AsyncZMQ(pull)
+            s1 = AsyncZMQ(push)
+
+            for i in range(10):
+                await s1.send_multipart([str(i).encode('ascii')])
+
+            r = []
+            async for msg in s:
+                r.append(msg[0])
+                if len(r) == 10:
+                    s.close()
+
+            s1.close()
+            return r
+
+        assert run(main()) == [str(i).encode('ascii') for i in range(10)]
+
+    def test_concurrent_recv(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+
+        async def main():
+            s = AsyncZMQ(pull)
+            s1 = AsyncZMQ(push)
+
+            tasks = [asyncio.ensure_future(s.recv_multipart())
+                    for i in range(3)]
+            await asyncio.sleep(0.01)
+            for i in range(3):
+                await s1.send_multipart([str(i).encode('ascii')])
+
+            r = await asyncio.gather(*tasks)
+            s.close()
+            s1.close()
+            return [msg[0] for msg in r]
+
+        assert run(main()) == [b'0', b'1', b'2']
+
+    def test_close(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+
+        async def main():
+            s = AsyncZMQ(pull)
+            task = asyncio.ensure_future(s.recv_multipart())
+            await asyncio.sleep(0.01)
+            s.close()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+            return False
+
+        assert run(main())
+
+    def test_loop_required(self):
+        a, b = self.create_bound_pair(zmq.PAIR, zmq.PAIR)
+        with self.assertRaises(RuntimeError):
+            AsyncZMQ(a)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+from zmq.tests import BaseZMQTestCase
+
+from uzmq import bench
+
+
+class TestBench(BaseZMQTestCase):
+
+    def test_run_case(self):
+        for impl in sorted(bench.IMPLS):
+            for pattern in ("reqrep", "pushpull"):
+                r = bench.run_case(self.context, impl, pattern, "inproc",
+                        16, 2, count=50, latency_count=10, timeout=5.0)
+
+                assert "error" not in r, r
+                assert r["impl"] == impl
+                assert r["msgs_per_sec"] > 0
+                assert r["p50_us"] <= r["p99_us"]
+
+    def test_memory_case(self):
+        for impl in sorted(bench.HANDLES):
+            r = bench.memory_case(impl, 20)
+            assert r["impl"] == impl
+            assert r["handles"] == 20
+            assert 0 < r["bytes_per_handle"] <= r["bytes_per_reading_handle"]
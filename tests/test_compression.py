@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+import os
+import time
+
+import pyuv
+import zmq
+
+from uzmq.buffers import BufferPool
+from uzmq.compression import Compressor, FLAG_MAGIC, decompress
+
+from base import HandleTestCase
+
+
+def wait():
+    time.sleep(.25)
+
+
+class TestCompression(HandleTestCase):
+
+    def test_compressor(self):
+        c = Compressor('zlib', threshold=100)
+        big = b'x' * 1000
+        noise = os.urandom(1000)
+
+        # nothing compressible
+        msg = [b'small', noise]
+        assert c.compress(msg) is msg
+        assert decompress(msg) == msg
+
+        msg = [b'small', big, noise, big]
+        frames = c.compress(msg)
+        assert len(frames) == 5
+        assert frames[0] == b'small' and frames[2] == noise
+        assert len(frames[1]) < 100
+        assert frames[-1].startswith(FLAG_MAGIC)
+        assert decompress(frames) == msg
+
+        # the leading frames are skipped
+        c = Compressor('zlib', threshold=100, skip=1)
+        frames = c.compress([big, big])
+        assert frames[0] == big and len(frames[1]) < 100
+        assert decompress(frames) == [big, big]
+
+        self.assertRaises(ValueError, Compressor, 'unknown')
+
+    def _run(self, pool=None, **kwargs):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, push)
+        s1 = self._zmq(loop, pull)
+        s.set_compression(threshold=100, **kwargs)
+        s1.set_compression()
+
+        sent = []
+        for i in range(20):
+            if i % 3:
+                msg = [str(i).encode('ascii'), b'x' * (1000 * i)]
+            else:
+                msg = [str(i).encode('ascii')]
+            sent.append(msg)
+            s.write_multipart(msg)
+
+        r = []
+        def cb(handle, msg, err):
+            if pool is not None:
+                frames, msg = msg, [bytes(f) for f in msg]
+                pool.release(*frames)
+            r.append(msg)
+            if len(r) == len(sent):
+                s.close()
+                s1.close()
+
+        s1.start_read(cb, copy=False, pool=pool)
+        loop.run()
+        assert [[f.bytes if isinstance(f, zmq.Frame) else f for f in m]
+            for m in r] == sent
+
+    def test_handle(self):
+        self._run()
+
+    def test_read_pool(self):
+        pool = BufferPool(size=32768, count=4)
+        self._run(pool=pool)
+        # the buffers of the compressed and flag frames are given back
+        assert len(pool) == 4
+
+    def test_executor(self):
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError:
+            return
+
+        executor = ThreadPoolExecutor(4)
+        try:
+            self._run(executor=executor)
+        finally:
+            executor.shutdown()
+
+    def test_pubsub(self):
+        pub, sub = self.create_bound_pair(zmq.PUB, zmq.SUB)
+        sub.setsockopt(zmq.SUBSCRIBE, b'prices.')
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, pub)
+        s1 = self._zmq(loop, sub)
+        s.set_compression(threshold=100)
+        s1.set_compression()
+
+        # the topic frame is never compressed, so it still matches the
+        # subscription.
+        sent = [[b'prices.EURUSD ' + b'x' * 2000],
+                [b'prices.EURUSD', b'y' * 2000]]
+        for msg in sent:
+            s.write_multipart(msg)
+
+        r = []
+        def cb(handle, msg, err):
+            r.append(msg)
+            if len(r) == len(sent):
+                s.close()
+                s1.close()
+
+        s1.start_read(cb)
+        loop.run()
+        assert r == sent
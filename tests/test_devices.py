@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+import time
+
+import pyuv
+import zmq
+
+from uzmq.devices import Proxy, Streamer
+
+from base import HandleTestCase
+
+
+def wait():
+    time.sleep(.25)
+
+
+class TestDevices(HandleTestCase):
+
+    def test_proxy(self):
+        req, frontend = self.create_bound_pair(zmq.REQ, zmq.ROUTER)
+        backend, rep = self.create_bound_pair(zmq.DEALER, zmq.REP)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        proxy = Proxy(loop, frontend, backend)
+        self.handles.extend([proxy.frontend, proxy.backend])
+        client = self._zmq(loop, req)
+        worker = self._zmq(loop, rep)
+
+        r = []
+        def on_request(handle, msg, err):
+            worker.write_multipart(msg + [b'!'])
+
+        def on_reply(handle, msg, err):
+            r.append(msg)
+            if len(r) == 5:
+                proxy.close()
+                client.stop()
+                worker.stop()
+            else:
+                client.write(str(len(r)).encode('ascii'))
+
+        worker.start_read(on_request)
+        client.start_read(on_reply)
+        proxy.start()
+        client.write(b'0')
+
+        loop.run()
+        assert r == [[str(i).encode('ascii'), b'!'] for i in range(5)]
+
+    def test_streamer_backpressure(self):
+        push, frontend = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        backend = self.context.socket(zmq.PUSH)
+        backend.setsockopt(zmq.SNDHWM, 1)
+        backend.setsockopt(zmq.LINGER, 0)
+        port = backend.bind_to_random_port("tcp://127.0.0.1")
+        capture, capture_pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        self.sockets.extend([backend])
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        streamer = Streamer(loop, frontend, backend, capture=capture,
+                batch=1, max_queue=10)
+        self.handles.extend([streamer.frontend, streamer.backend,
+            streamer.capture])
+        streamer.start()
+
+        for i in range(100):
+            push.send(str(i).encode('ascii'))
+
+        # nobody reads the backend, reading the frontend is paused
+        def on_timeout(h):
+            h.close()
+            loop.stop()
+        loop.update_time()
+        t = pyuv.Timer(loop)
+        t.start(on_timeout, 0.3, 0.0)
+        loop.run()
+
+        assert streamer.backend.queued_messages == 10
+        assert frontend.poll(0)
+
+        pull = self.context.socket(zmq.PULL)
+        pull.setsockopt(zmq.LINGER, 0)
+        self.sockets.append(pull)
+        pull.connect("tcp://127.0.0.1:%s" % port)
+        wait()
+
+        r = []
+        def cb(handle, msg, err):
+            r.append(msg[0])
+            if len(r) == 100:
+                streamer.close()
+                reader.stop()
+
+        reader = self._zmq(loop, pull)
+        reader.start_read(cb)
+        loop.run()
+
+        assert r == [str(i).encode('ascii') for i in range(100)]
+        captured = [capture_pull.recv() for i in range(10)]
+        assert captured == r[:10]
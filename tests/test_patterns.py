@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+import time
+
+import pyuv
+import zmq
+
+from uzmq import ZMQ
+from uzmq.patterns import Broker, Worker, READY
+
+from base import HandleTestCase
+
+
+def wait():
+    time.sleep(.25)
+
+
+class TestBroker(HandleTestCase):
+
+    def _socket(self, socket_type):
+        s = self.context.socket(socket_type)
+        s.setsockopt(zmq.LINGER, 0)
+        self.sockets.append(s)
+        return s
+
+    def _broker(self, loop, **kwargs):
+        frontend = self._socket(zmq.ROUTER)
+        backend = self._socket(zmq.ROUTER)
+        self.frontend_addr = "tcp://127.0.0.1:%s" % (
+                frontend.bind_to_random_port("tcp://127.0.0.1"))
+        self.backend_addr = "tcp://127.0.0.1:%s" % (
+                backend.bind_to_random_port("tcp://127.0.0.1"))
+
+        broker = Broker(loop, frontend, backend, **kwargs)
+        self.handles.append(broker)
+        return broker
+
+    def test_broker(self):
+        loop = pyuv.Loop.default_loop()
+        broker = self._broker(loop, max_pending=4)
+
+        handled = []
+        def handler(worker, envelope, payload):
+            handled.append(worker)
+            return [payload[0] + b'!']
+
+        workers = []
+        for i in range(3):
+            s = self._socket(zmq.DEALER)
+            s.connect(self.backend_addr)
+            w = Worker(loop, s, handler, capacity=2)
+            self.handles.append(w)
+            workers.append(w)
+
+        r = []
+        clients = []
+        def on_reply(handle, msg, err):
+            r.append(msg[0])
+            if len(r) == 30:
+                broker.close()
+                for h in workers + clients:
+                    h.close()
+            elif len(r) <= 25:
+                handle.write(str(len(r)).encode('ascii'))
+
+        for i in range(5):
+            s = self._socket(zmq.REQ)
+            s.connect(self.frontend_addr)
+            c = ZMQ(loop, s)
+            self.handles.append(c)
+            clients.append(c)
+            c.start_read(on_reply)
+        wait()
+
+        loop.update_time()
+        broker.start()
+        for w in workers:
+            w.start()
+        for c in clients:
+            c.write(b'x')
+
+        loop.run()
+        assert len(r) == 30
+        assert all(m.endswith(b'!') for m in r)
+        assert set(handled) == set(workers)
+
+    def test_eviction(self):
+        loop = pyuv.Loop.default_loop()
+        broker = self._broker(loop, heartbeat_interval=0.05,
+                heartbeat_liveness=2)
+
+        alive = self._socket(zmq.DEALER)
+        alive.connect(self.backend_addr)
+        worker = Worker(loop, alive, lambda w, e, p: p)
+        self.handles.append(worker)
+
+        dead = self._socket(zmq.DEALER)
+        dead.connect(self.backend_addr)
+        wait()
+
+        dead.send(READY)
+        loop.update_time()
+        broker.start()
+        worker.start()
+
+        counts = []
+        def check(h):
+            counts.append(broker.workers)
+            if len(counts) == 10:
+                h.close()
+                broker.close()
+                worker.close()
+
+        t = pyuv.Timer(loop)
+        t.start(check, 0.05, 0.05)
+        loop.run()
+
+        assert max(counts) == 2
+        assert counts[-1] == 1
@@ -8,7 +8,7 @@ from zmq.tests import BaseZMQTestCase
 
 import time
 
-from uzmq import ZMQPoll
+from uzmq import ZMQPoll, ZMQPollGroup
 
 def wait():
     time.sleep(.25)
@@ -125,3 +125,71 @@ class TestPoll(BaseZMQTestCase):
 
         assert r == [b'echo', b'echo']
         assert r1 == [b'echo', b'echo']
+
+    def test_pending_messages(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        for i in range(3):
+            push.send(b'msg')
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        p = ZMQPoll(loop, pull)
+
+        r = []
+        def cb(handle, ev, error):
+            # only read one message per event, the handle must come
+            # back for the others.
+            r.append(pull.recv())
+            if len(r) == 3:
+                handle.close()
+
+        p.start(pyuv.UV_READABLE, cb)
+        loop.run()
+
+        assert r == [b'msg', b'msg', b'msg']
+
+    def test_timeout(self):
+        req, rep = self.create_bound_pair(zmq.REQ, zmq.REP)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        p = ZMQPoll(loop, rep)
+
+        r = []
+        def cb(handle, ev, error):
+            r.append(rep.recv())
+            handle.close()
+
+        p.start(pyuv.UV_READABLE, cb, 0.01)
+        req.send(b'req')
+        loop.run()
+
+        assert r == [b'req']
+
+    def test_group(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        push1, pull1 = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        group = ZMQPollGroup(loop)
+
+        r = []
+        def cb(socket, ev, error):
+            r.append((ev & pyuv.UV_READABLE, socket.recv()))
+            group.unregister(socket)
+            if not len(group):
+                group.close()
+
+        group.register(pull, pyuv.UV_READABLE, cb)
+        group.register(pull1, pyuv.UV_READABLE, cb)
+        assert len(group) == 2
+        assert pull in group
+
+        push.send(b'a')
+        push1.send(b'b')
+        loop.run()
+
+        assert sorted(r) == [(1, b'a'), (1, b'b')]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+import threading
+
+import zmq
+from zmq.tests import BaseZMQTestCase
+
+from uzmq import LoopPool
+
+
+class TestLoopPool(BaseZMQTestCase):
+
+    def test_placement(self):
+        pool = LoopPool(3)
+        assert len(pool) == 3
+        assert len(set(pool.loops)) == 3
+
+        # round robin
+        assert [pool.loop_for() for i in range(4)] == pool.loops + \
+                pool.loops[:1]
+
+        # by key
+        assert pool.loop_for("a") is pool.loop_for("a")
+
+    def test_write(self):
+        pool = LoopPool(2)
+        pool.start()
+
+        n = 4
+        pairs = [self.create_bound_pair(zmq.PUSH, zmq.PULL)
+                for i in range(n)]
+
+        received = []
+        done = threading.Event()
+        lock = threading.Lock()
+        def cb(handle, msg, err):
+            with lock:
+                received.append(msg[0])
+                if len(received) == n * 10:
+                    done.set()
+
+        writers = []
+        for i, (push, pull) in enumerate(pairs):
+            reader = pool.add(pull)
+            pool.call(reader, reader.start_read, cb)
+            writers.append(pool.add(push, key=i))
+
+        def produce(handle):
+            for i in range(10):
+                pool.write(handle, [b'msg'])
+
+        threads = [threading.Thread(target=produce, args=(w,))
+                for w in writers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert done.wait(5)
+        pool.stop()
+        assert not pool.started
+
+        assert received == [b'msg'] * n * 10
+        assert len(set(w.loop for w in writers)) == 2
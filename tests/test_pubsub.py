@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+import time
+
+import pyuv
+import zmq
+
+from uzmq.pubsub import Publisher, Subscriber, SNAPSHOT, SNAPSHOT_END
+
+from base import HandleTestCase
+
+
+def wait():
+    time.sleep(.25)
+
+
+class TestSubscriber(HandleTestCase):
+
+    def test_dispatch(self):
+        pub, sub = self.create_bound_pair(zmq.PUB, zmq.SUB)
+
+        loop = pyuv.Loop.default_loop()
+        subscriber = Subscriber(loop, sub)
+        self.handles.append(subscriber)
+
+        r = []
+        def handler(name):
+            def cb(s, msg):
+                r.append((name, msg[0]))
+                if msg[0] == b'end':
+                    subscriber.close()
+            return cb
+
+        a, ab, ab2, end = (handler("a"), handler("ab"), handler("ab2"),
+                handler("end"))
+        subscriber.subscribe(b'a', a)
+        subscriber.subscribe(b'ab', ab)
+        subscriber.subscribe(b'ab', ab2)
+        subscriber.subscribe(b'abc', a)
+        subscriber.subscribe(u'end', end)
+        assert subscriber.topics == [b'a', b'ab', b'abc', b'end']
+
+        # ab stays subscribed for the other handler
+        subscriber.unsubscribe(b'ab', ab2)
+        subscriber.unsubscribe(b'abc', a)
+        self.assertRaises(ValueError, subscriber.unsubscribe, b'abc', a)
+        self.assertRaises(ValueError, subscriber.unsubscribe, b'b', a)
+        assert subscriber.topics == [b'a', b'ab', b'end']
+        wait()
+
+        subscriber.start()
+        for topic in (b'a1', b'abc', b'b', b'ba', b'end'):
+            pub.send(topic)
+
+        loop.run()
+        assert r == [("a", b'a1'), ("a", b'abc'), ("ab", b'abc'),
+                ("end", b'end')]
+
+    def test_conflate(self):
+        pub = self.socket(zmq.XPUB)
+        sub = self.socket(zmq.SUB)
+        for s in (pub, sub):
+            s.setsockopt(zmq.LINGER, 0)
+        pub.setsockopt(zmq.SNDHWM, 5)
+        sub.setsockopt(zmq.RCVHWM, 5)
+        pub.bind('inproc://conflate')
+        sub.connect('inproc://conflate')
+        sub.setsockopt(zmq.SUBSCRIBE, b'')
+        wait()
+
+        loop = pyuv.Loop()
+        # a PUB socket would drop the updates instead of blocking
+        plain = self.socket(zmq.PUB)
+        self.assertRaises(ValueError, Publisher, loop, plain)
+
+        publisher = Publisher(loop, pub, max_queue=2)
+        self.handles.append(publisher)
+        reader = self._zmq(loop, sub)
+
+        count = 20000
+        state = dict(sent=0, pending=0)
+        def publish(handle):
+            # a hundred updates per loop iteration
+            for i in range(100):
+                publisher.publish([b'a', str(state['sent']).encode('ascii')])
+                state['sent'] += 1
+            state['pending'] = max(state['pending'], publisher.pending)
+            if state['sent'] == count:
+                handle.close()
+
+        r = []
+        def cb(handle, msg, err):
+            # a slow subscriber
+            time.sleep(0.0005)
+            r.append(msg)
+            if msg == [b'a', str(count - 1).encode('ascii')]:
+                publisher.close()
+                reader.close()
+                timer.close()
+
+        timer = pyuv.Timer(loop)
+        timer.start(lambda h: loop.stop(), 10.0, 0)
+        idle = pyuv.Idle(loop)
+        idle.start(publish)
+        reader.start_read(cb)
+        loop.run()
+
+        # the subscriber fell behind and missed updates, but got the
+        # last one.
+        assert state['pending'] == 1
+        assert len(r) < count
+        assert r[-1] == [b'a', str(count - 1).encode('ascii')]
+        values = [int(msg[1]) for msg in r]
+        assert values == sorted(values)
+
+    def test_snapshot(self):
+        pub, sub = self.create_bound_pair(zmq.XPUB, zmq.SUB)
+        router, dealer = self.create_bound_pair(zmq.ROUTER, zmq.DEALER)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        publisher = Publisher(loop, pub, snapshot=router)
+        self.handles.append(publisher)
+        client = self._zmq(loop, dealer)
+
+        for topic in (b'a.1', b'a.2', b'b.1', b'a.1'):
+            publisher.publish([topic, b'v'])
+        publisher.publish([b'a.2', b'last'])
+
+        r = []
+        def cb(handle, msg, err):
+            r.append(msg)
+            if msg == [SNAPSHOT_END]:
+                publisher.close()
+                client.close()
+
+        client.start_read(cb)
+        client.write(b'a.')
+        loop.run()
+        assert sorted(r[:-1]) == [[SNAPSHOT, b'a.1', b'v'],
+                [SNAPSHOT, b'a.2', b'last']]
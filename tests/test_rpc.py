@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+import time
+
+import pyuv
+import zmq
+
+from uzmq import ZMQ, RequestTimeout
+from uzmq.rpc import Client, Future
+
+from base import HandleTestCase
+
+
+def wait():
+    time.sleep(.25)
+
+
+class TestClient(HandleTestCase):
+
+    def test_pipelining(self):
+        dealer, router = self.create_bound_pair(zmq.DEALER, zmq.ROUTER)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        client = Client(loop, dealer)
+        server = ZMQ(loop, router)
+        self.handles.extend([client, server])
+
+        # reply once all the requests are received, in reverse order
+        received = []
+        def on_request(handle, msgs, err):
+            received.extend(msgs)
+            if len(received) == 10:
+                for msg in reversed(received):
+                    server.write_multipart(msg[:-1] + [msg[-1] + b'!'])
+
+        r = []
+        def on_reply(c, reply, err):
+            assert err is None
+            r.append(reply[0])
+            if len(r) == 10:
+                client.close()
+                server.close()
+
+        server.start_read(batch_callback=on_request, batch=10)
+        for i in range(10):
+            client.request([str(i).encode('ascii')], on_reply)
+        assert len(client) == 10
+
+        loop.run()
+        assert r == [str(i).encode('ascii') + b'!'
+                for i in reversed(range(10))]
+
+    def test_rep_future(self):
+        if Future is None:
+            return
+
+        dealer, rep = self.create_bound_pair(zmq.DEALER, zmq.REP)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        client = Client(loop, dealer)
+        server = ZMQ(loop, rep)
+        self.handles.extend([client, server])
+
+        def on_request(handle, msg, err):
+            server.write_multipart([msg[0] * 2])
+
+        futures = []
+        def on_done(f):
+            if all(f.done() for f in futures):
+                client.close()
+                server.close()
+
+        server.start_read(on_request)
+        for i in range(3):
+            futures.append(client.request([str(i).encode('ascii')]))
+        for f in futures:
+            f.add_done_callback(on_done)
+
+        loop.run()
+        assert [f.result() for f in futures] == [[b'00'], [b'11'], [b'22']]
+
+    def test_timeout(self):
+        dealer, router = self.create_bound_pair(zmq.DEALER, zmq.ROUTER)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        loop.update_time()
+        client = Client(loop, dealer, timeout=0.1)
+        server = ZMQ(loop, router)
+        self.handles.extend([client, server])
+
+        # only answer the second request
+        def on_request(handle, msg, err):
+            if msg[-1] == b'b':
+                server.write_multipart(msg)
+
+        r = []
+        def on_reply(c, reply, err):
+            r.append((reply, type(err)))
+            if len(r) == 3:
+                client.close()
+                server.close()
+
+        server.start_read(on_request)
+        client.request([b'a'], on_reply)
+        client.request([b'b'], on_reply)
+        client.request([b'c'], on_reply, timeout=0.2)
+
+        t0 = time.time()
+        loop.run()
+        assert r == [([b'b'], type(None)), (None, RequestTimeout),
+                (None, RequestTimeout)]
+        assert time.time() - t0 >= 0.2
+        assert len(client) == 0
+
+    def test_read_error(self):
+        dealer, router = self.create_bound_pair(zmq.DEALER, zmq.ROUTER)
+
+        loop = pyuv.Loop()
+        client = Client(loop, dealer)
+        self.handles.append(client)
+
+        r = []
+        client.request([b'a'], lambda c, reply, err: r.append(err))
+        # receive errors are passed as (None, errno) to the batch
+        # callback, the pending requests are kept.
+        client.handle._read_error(zmq.EMSGSIZE)
+        assert len(client) == 1
+        assert not r
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+import unittest
+
+import pyuv
+
+from uzmq.scheduler import Scheduler, get_scheduler
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_schedule(self):
+        loop = pyuv.Loop()
+        scheduler = Scheduler(loop)
+
+        r = []
+        def cb(name):
+            r.append(name)
+            if name == "a":
+                # runs on the next iteration
+                scheduler.schedule("c", lambda: cb("c"))
+                scheduler.cancel("x")
+
+        scheduler.schedule("a", lambda: cb("a"))
+        scheduler.schedule("b", lambda: cb("b"))
+        scheduler.schedule("a", lambda: cb("ignored"))
+        scheduler.schedule("x", lambda: cb("x"))
+        assert len(scheduler) == 3
+
+        loop.run(pyuv.UV_RUN_ONCE)
+        assert r == ["a", "b"]
+
+        loop.run()
+        assert r == ["a", "b", "c"]
+        assert len(scheduler) == 0
+
+    def test_max_calls(self):
+        loop = pyuv.Loop()
+        scheduler = Scheduler(loop, max_calls=2)
+
+        r = []
+        for i in range(5):
+            scheduler.schedule(i, lambda i=i: r.append(i))
+
+        loop.run(pyuv.UV_RUN_ONCE)
+        assert r == [0, 1]
+
+        loop.run()
+        assert r == [0, 1, 2, 3, 4]
+
+    def test_get_scheduler(self):
+        loop = pyuv.Loop()
+        scheduler = get_scheduler(loop)
+        assert get_scheduler(loop) is scheduler
+
+        scheduler.close()
+        assert get_scheduler(loop) is not scheduler
+
+    def test_error(self):
+        loop = pyuv.Loop()
+        scheduler = Scheduler(loop)
+
+        r = []
+        def fail():
+            1 / 0
+
+        scheduler.schedule("a", fail)
+        scheduler.schedule("b", lambda: r.append("b"))
+        with self.assertLogs(level='ERROR') as logs:
+            loop.run()
+
+        # the traceback is logged and the other callbacks still run
+        assert "ZeroDivisionError" in logs.output[0]
+        assert r == ["b"]
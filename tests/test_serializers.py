@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+import pickle
+import time
+
+import pyuv
+import zmq
+
+from uzmq.serializers import (JSONCodec, PickleCodec, get_serializer,
+        register)
+
+from base import HandleTestCase
+
+
+def wait():
+    time.sleep(.25)
+
+
+class TestSerializers(HandleTestCase):
+
+    def test_codecs(self):
+        obj = {"a": [1, 2.5, "b"], "c": None}
+        for name in ("json", "pickle"):
+            codec = get_serializer(name)
+            assert codec.loads(codec.dumps(obj)) == obj
+
+        self.assertRaises(ValueError, get_serializer, "unknown")
+        self.assertRaises(TypeError, register, "bad", object())
+
+        codec = JSONCodec()
+        register("test-json", codec)
+        assert get_serializer("test-json") is codec
+        assert get_serializer(codec) is codec
+
+    def test_pickle_out_of_band(self):
+        if pickle.HIGHEST_PROTOCOL < 5:
+            return
+
+        codec = PickleCodec(oob_threshold=1024)
+        big = bytearray(b'x' * 4096)
+        frames = codec.dumps({"small": pickle.PickleBuffer(b'y' * 10),
+            "big": pickle.PickleBuffer(big)})
+
+        # the big buffer is a separate frame sharing the memory of the
+        # object
+        assert len(frames) == 2
+        assert frames[1].obj is big
+
+        obj = codec.loads([bytes(f) for f in frames])
+        assert bytes(obj["big"]) == big
+        assert bytes(obj["small"]) == b'y' * 10
+
+    def test_write_obj(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, push, serializer="pickle")
+        s1 = self._zmq(loop, pull, serializer="pickle")
+
+        r = []
+        def cb(handle, obj, err):
+            # received without copy, copy the buffer before it's freed
+            r.append((obj[0], bytes(obj[1])))
+            if len(r) == 2:
+                s.close()
+                s1.close()
+
+        s1.start_read(cb, copy=False, decode=True)
+        big = b'a' * 100000
+        if pickle.HIGHEST_PROTOCOL >= 5:
+            big = pickle.PickleBuffer(big)
+        s.write_obj((1, big))
+        s.write_obj((2, b'b'))
+
+        loop.run()
+        assert r == [(1, b'a' * 100000), (2, b'b')]
+
+        h = self._zmq(loop, pull)
+        self.assertRaises(ValueError, h.write_obj, 1)
+        h.close()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+import time
+import unittest
+
+import pyuv
+
+from uzmq.timers import TimerWheel, get_timer_wheel
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_schedule(self):
+        loop = pyuv.Loop()
+        # 8 slots of 10ms, the last timeouts need several turns
+        wheel = TimerWheel(loop, resolution=0.01, slots=8)
+
+        r = []
+        def cb(name):
+            r.append((name, time.time() - t0))
+
+        t0 = time.time()
+        wheel.schedule(0.05, cb, "b")
+        wheel.schedule(0.02, cb, "a")
+        wheel.schedule(0.05, cb, "c")
+        cancelled = wheel.schedule(0.03, cb, "x")
+        wheel.schedule(0.2, cb, "d")
+        cancelled.cancel()
+        assert not cancelled.active
+        assert len(wheel) == 4
+
+        loop.run()
+
+        assert [name for name, t in r] == ["a", "b", "c", "d"]
+        for (name, t), delay in zip(r, (0.02, 0.05, 0.05, 0.2)):
+            assert delay <= t < delay + 0.05
+        assert len(wheel) == 0
+
+    def test_reschedule(self):
+        loop = pyuv.Loop()
+        wheel = get_timer_wheel(loop)
+        assert get_timer_wheel(loop) is wheel
+
+        r = []
+        def cb():
+            r.append(time.time())
+            if len(r) < 3:
+                wheel.schedule(0.02, cb)
+
+        wheel.schedule(0.02, cb)
+        loop.run()
+        assert len(r) == 3
+
+        wheel.close()
+        assert get_timer_wheel(loop) is not wheel
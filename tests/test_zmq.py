@@ -1,27 +1,33 @@
 # -*- coding: utf-8 -
 #
 # This file is part of uzmq. See the NOTICE for more information.
+import threading
 import time
 
 import pyuv
 import zmq
-from zmq.tests import BaseZMQTestCase
 
-from uzmq import ZMQ
+from uzmq import QueueFull, MessageExpired
+from uzmq import sock
+from uzmq.buffers import BufferPool
+from uzmq.sock import (QUEUE_BLOCK, QUEUE_DROP_NEWEST, QUEUE_DROP_OLDEST,
+        QUEUE_RAISE)
+
+from base import HandleTestCase
 
 
 def wait():
     time.sleep(.25)
 
 
-class TestZMQStream(BaseZMQTestCase):
+class TestZMQStream(HandleTestCase):
 
     def test_simple(self):
         req, rep = self.create_bound_pair(zmq.REQ, zmq.REP)
         wait()
 
         loop = pyuv.Loop.default_loop()
-        s = ZMQ(loop, rep)
+        s = self._zmq(loop, rep)
 
         r = []
         def cb(stream, msg, err):
@@ -45,8 +51,8 @@ class TestZMQStream(BaseZMQTestCase):
         wait()
 
         loop = pyuv.Loop.default_loop()
-        s = ZMQ(loop, rep)
-        s1 = ZMQ(loop, req)
+        s = self._zmq(loop, rep)
+        s1 = self._zmq(loop, req)
 
         r = []
         def cb(stream, msg, err):
@@ -75,8 +81,8 @@ class TestZMQStream(BaseZMQTestCase):
         wait()
 
         loop = pyuv.Loop.default_loop()
-        s = ZMQ(loop, sub)
-        s1 = ZMQ(loop, pub)
+        s = self._zmq(loop, sub)
+        s1 = self._zmq(loop, pub)
 
         r = []
         def cb(stream, msg, err):
@@ -96,8 +102,8 @@ class TestZMQStream(BaseZMQTestCase):
         wait()
 
         loop = pyuv.Loop.default_loop()
-        s = ZMQ(loop, sub)
-        s1 = ZMQ(loop, pub)
+        s = self._zmq(loop, sub)
+        s1 = self._zmq(loop, pub)
 
         r = []
         def cb(stream, msg, err):
@@ -112,3 +118,510 @@ class TestZMQStream(BaseZMQTestCase):
 
         loop.run()
         assert r == [b'xmessage']
+
+    def test_read_batch(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        for i in range(10):
+            push.send(str(i).encode('ascii'))
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, pull)
+
+        r = []
+        def cb(stream, msgs, err):
+            r.append([msg[0] for msg in msgs])
+            if sum(len(b) for b in r) == 10:
+                s.stop()
+
+        s.start_read(batch_callback=cb, batch=4)
+        loop.run()
+
+        assert [len(b) for b in r] == [4, 4, 2]
+        assert sum(r, []) == [str(i).encode('ascii') for i in range(10)]
+
+    def test_stop_read(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        for i in range(3):
+            push.send(b'msg')
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, pull)
+
+        def stop(handle):
+            s.stop()
+
+        t = pyuv.Timer(loop)
+
+        r = []
+        def cb(stream, msg, err):
+            r.append(msg[0])
+            stream.stop_read()
+            t.start(stop, 0.2, 0.0)
+
+        s.start_read(cb, batch=10)
+        loop.run()
+
+        assert r == [b'msg']
+
+    def test_write_batch(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, pull)
+        s1 = self._zmq(loop, push)
+
+        sent = []
+        def sent_cb(stream, msg, status):
+            sent.append(msg[0])
+
+        r = []
+        def cb(stream, msg, err):
+            r.append(msg[0])
+            if len(r) == 100:
+                s.stop()
+                s1.stop()
+
+        s.start_read(cb, batch=100)
+        for i in range(100):
+            s1.write(b'msg', callback=sent_cb)
+
+        # one loop iteration is enough to send the whole queue
+        loop.run(pyuv.UV_RUN_NOWAIT)
+        assert len(sent) == 100
+        assert not s1._send_queue
+
+        loop.run()
+        assert len(r) == 100
+
+    def _unconnected(self, socket_type):
+        socket = self.context.socket(socket_type)
+        self.sockets.append(socket)
+        socket.bind_to_random_port('tcp://127.0.0.1')
+        return socket
+
+    def test_queue_limit(self):
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, self._unconnected(zmq.PUSH))
+
+        hw = []
+        s.set_queue_limit(max_messages=2, policy=QUEUE_RAISE,
+                on_high_water=lambda h: hw.append(h))
+
+        s.write(b'a')
+        s.write(b'bb')
+        assert s.queued_messages == 2
+        assert s.queued_bytes == 3
+        assert hw == [s]
+
+        self.assertRaises(QueueFull, s.write, b'c')
+        s.close()
+
+    def test_queue_drop(self):
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, self._unconnected(zmq.PUSH))
+
+        dropped = []
+        def cb(stream, msg, status):
+            if isinstance(status, QueueFull):
+                dropped.append(msg[0])
+
+        s.set_queue_limit(max_messages=2, policy=QUEUE_DROP_NEWEST)
+        s.write(b'a', callback=cb)
+        s.write(b'bb', callback=cb)
+        s.write(b'c', callback=cb)
+        assert dropped == [b'c']
+
+        s.set_queue_limit(max_bytes=4, policy=QUEUE_DROP_OLDEST)
+        s.write(b'dd', callback=cb)
+        assert dropped == [b'c', b'a']
+        assert s.queued_messages == 2
+        assert s.queued_bytes == 4
+        s.close()
+
+    def test_queue_drain(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, push)
+
+        r = []
+        def on_drain(handle):
+            r.append(handle.queued_messages)
+            s.stop()
+
+        s.set_queue_limit(max_messages=2, policy=QUEUE_BLOCK,
+                on_drain=on_drain)
+        for i in range(3):
+            s.write(b'msg')
+        assert s.queued_messages == 3
+
+        loop.run()
+        assert r == [0]
+        assert s.queued_bytes == 0
+
+    def test_send_ttl(self):
+        loop = pyuv.Loop.default_loop()
+        loop.update_time()
+        s = self._zmq(loop, self._unconnected(zmq.PUSH))
+        s.enable_stats()
+        s.send_ttl = 0.05
+
+        r = []
+        def cb(handle, msg, status):
+            r.append((msg[0], type(status)))
+            if len(r) == 3:
+                s.stop()
+
+        s.write(b'a', callback=cb, ttl=0.1)
+        s.write(b'b', callback=cb)
+        s.write(b'c', callback=cb, ttl=0.3)
+        assert s.queued_messages == 3
+
+        t0 = time.time()
+        loop.run()
+        assert r == [(b'b', MessageExpired), (b'a', MessageExpired),
+                (b'c', MessageExpired)]
+        assert time.time() - t0 >= 0.3
+        assert s.queued_messages == 0
+        assert s.queued_bytes == 0
+        assert s.stats()["expired"] == 3
+
+    def test_write_buffers(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, pull)
+        s1 = self._zmq(loop, push)
+
+        big = b'x' * (s1.copy_threshold + 1)
+        mutable = bytearray(big)
+
+        status = []
+        def sent_cb(stream, msg, st):
+            status.append(st)
+
+        r = []
+        def cb(stream, msg, err):
+            r.append(msg)
+            if len(r) == 3:
+                s.stop()
+                s1.stop()
+
+        s.start_read(cb)
+        s1.write_multipart([u'text', bytearray(b'array'),
+            memoryview(b'view'), zmq.Frame(b'frame')], callback=sent_cb)
+        s1.write(big, track=True, callback=sent_cb)
+        # mutable buffers are copied
+        s1.write(mutable, track=True, callback=sent_cb)
+        assert s1.queued_bytes == 4 + 5 + 4 + 5 + 2 * len(big)
+        loop.run()
+
+        assert r[0] == [b'text', b'array', b'view', b'frame']
+        assert r[1] == r[2] == [big]
+        assert status[0] is None
+        assert isinstance(status[1], zmq.MessageTracker)
+        assert status[2] is None
+
+    def test_on_released(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, pull)
+        s1 = self._zmq(loop, push)
+
+        buf = bytearray(b'x' * 200000)
+
+        released = []
+        def on_released(stream, msg):
+            released.append(msg)
+            s1.stop()
+
+        r = []
+        def cb(stream, msg, err):
+            r.append(msg)
+            s.stop()
+
+        s.start_read(cb)
+        s1.write_multipart([b'head', buf], on_released=on_released)
+        loop.run()
+
+        assert len(r) == 1
+        assert r[0][1] == bytes(buf)
+        assert len(released) == 1
+        assert [bytes(f) for f in released[0]] == [b'head', bytes(buf)]
+
+    def test_track_timeout(self):
+        class Tracker(object):
+            done = False
+
+        class Message(object):
+            tracker = Tracker()
+            msg = [b'x']
+
+            def on_released(self, handle, msg):
+                released.append(msg)
+
+        released = []
+        loop = pyuv.Loop()
+        tracker = sock._Tracker(loop)
+        timeout, sock.TRACK_TIMEOUT = sock.TRACK_TIMEOUT, 0.05
+        try:
+            tracker.add(None, Message())
+            # the timer stops once the message is forgotten
+            loop.run()
+        finally:
+            sock.TRACK_TIMEOUT = timeout
+
+        assert not released
+        assert not tracker._tracked
+
+    def test_stats(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, pull)
+        s1 = self._zmq(loop, push)
+        assert s.stats() is None
+
+        s.enable_stats()
+        s1.enable_stats()
+
+        r = []
+        def cb(stream, msg, err):
+            r.append(msg)
+            if len(r) == 3:
+                s.stop()
+                s1.stop()
+
+        s.start_read(cb)
+        for i in range(3):
+            s1.write_multipart([b'ab', b'cde'])
+        loop.run()
+
+        stats = s.stats(reset=True)
+        assert stats['messages_received'] == 3
+        assert stats['bytes_received'] == 15
+        assert stats['callbacks'] == 3
+        assert stats['callback_time'] >= 0
+        assert s.stats()['messages_received'] == 0
+
+        stats1 = s1.stats()
+        assert stats1['messages_sent'] == 3
+        assert stats1['bytes_sent'] == 15
+        assert stats1['queue_high_water'] == 3
+        assert stats1['queued_messages'] == 0
+
+        s.disable_stats()
+        assert s.stats() is None
+
+    def test_read_executor(self):
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError:
+            return
+
+        dealer, router = self.create_bound_pair(zmq.DEALER, zmq.ROUTER)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, router)
+        s1 = self._zmq(loop, dealer)
+
+        def handler(msg):
+            # run in the pool, the first messages take longer
+            n = int(msg[1])
+            time.sleep(0.01 * (5 - n % 5))
+            return [msg[0], msg[1] + b'!']
+
+        r = []
+        def cb(stream, msg, err):
+            r.append(msg[0])
+            if len(r) == 10:
+                s.stop()
+                s1.stop()
+
+        executor = ThreadPoolExecutor(4)
+        s.start_read(handler, executor=executor, max_inflight=4)
+        s1.start_read(cb)
+        for i in range(10):
+            s1.write(str(i).encode('ascii'))
+
+        loop.run()
+        executor.shutdown()
+
+        assert r == [str(i).encode('ascii') + b'!' for i in range(10)]
+
+    def test_read_executor_error(self):
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError:
+            return
+
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop()
+        loop.update_time()
+        s = self._zmq(loop, pull)
+        s1 = self._zmq(loop, push)
+        s.enable_stats()
+
+        r = []
+        def handler(msg):
+            r.append(bytes(msg[0]))
+
+        # the first frame doesn't fit in the buffers of the pool
+        executor = ThreadPoolExecutor(2)
+        s.start_read(handler, executor=executor, pool=BufferPool(size=8))
+        s1.write(b'x' * 100)
+        s1.write(b'small')
+
+        t = pyuv.Timer(loop)
+        t.start(lambda h: loop.stop(), 0.5, 0)
+        loop.run()
+        t.close()
+        executor.shutdown()
+
+        assert r == [b'small']
+        assert s.stats()['recv_errors'] == 1
+
+    def test_write_threadsafe(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, push)
+        s1 = self._zmq(loop, pull)
+
+        r = []
+        def cb(stream, msg, err):
+            r.append(msg)
+            if len(r) == 400:
+                s.stop()
+                s1.stop()
+
+        s1.start_read(cb)
+
+        def produce(n):
+            for i in range(100):
+                s.write_multipart_threadsafe([str(n).encode('ascii'),
+                    str(i).encode('ascii')])
+
+        threads = [threading.Thread(target=produce, args=(n,))
+                for n in range(4)]
+        for t in threads:
+            t.start()
+
+        loop.run()
+        for t in threads:
+            t.join()
+
+        assert len(r) == 400
+        for n in range(4):
+            sent = [m[1] for m in r if m[0] == str(n).encode('ascii')]
+            assert sent == [str(i).encode('ascii') for i in range(100)]
+
+    def test_write_blocked_reading(self):
+        # a handle reading and writing at a small high water mark keeps
+        # sending once the peer catches up.
+        dealer = self.socket(zmq.DEALER)
+        router = self.socket(zmq.ROUTER)
+        for sock_ in (dealer, router):
+            sock_.setsockopt(zmq.LINGER, 0)
+            sock_.setsockopt(zmq.SNDHWM, 2)
+            sock_.setsockopt(zmq.RCVHWM, 2)
+        port = router.bind_to_random_port('tcp://127.0.0.1')
+        dealer.connect('tcp://127.0.0.1:%s' % port)
+        wait()
+
+        count = 20000
+        received = []
+        def consume():
+            poller = zmq.Poller()
+            poller.register(router, zmq.POLLIN)
+            while len(received) < count and poller.poll(5000):
+                received.append(router.recv_multipart())
+
+        t = threading.Thread(target=consume)
+        t.start()
+
+        loop = pyuv.Loop()
+        s = self._zmq(loop, dealer)
+        s.start_read(lambda handle, msg, err: None)
+
+        def on_sent(handle, msg, status):
+            if msg[0] == str(count - 1).encode('ascii'):
+                timer.close()
+                s.close()
+
+        for i in range(count):
+            s.write_multipart([str(i).encode('ascii'), b'x' * 100],
+                    callback=on_sent)
+
+        timer = pyuv.Timer(loop)
+        timer.start(lambda h: loop.stop(), 10.0, 0)
+        loop.run()
+        t.join()
+
+        assert len(received) == count
+
+    def test_read_pool(self):
+        push, pull = self.create_bound_pair(zmq.PUSH, zmq.PULL)
+        wait()
+
+        loop = pyuv.Loop.default_loop()
+        s = self._zmq(loop, push)
+        s1 = self._zmq(loop, pull)
+        pool = BufferPool(size=16, count=2)
+
+        r = []
+        def cb(handle, msg, err):
+            if msg is None:
+                r.append(err)
+            else:
+                r.append([bytes(f) for f in msg])
+                pool.release(*msg)
+
+            if len(r) == 4:
+                s.stop()
+                s1.stop()
+
+        s1.start_read(cb, pool=pool)
+        s.write_multipart([b'a', b'bc'])
+        s.write(b'x' * 17)
+        s.write_multipart([b'd', b'', b'e' * 16])
+        s.write(b'f')
+
+        loop.run()
+        assert r == [[b'a', b'bc'], zmq.EMSGSIZE, [b'd', b'', b'e' * 16],
+                [b'f']]
+        # the buffers are back in the pool
+        assert len(pool) == 2
+
+    def test_lazy_handles(self):
+        a, b = self.create_bound_pair(zmq.PAIR, zmq.PAIR)
+        loop = pyuv.Loop()
+        s = self._zmq(loop, a)
+
+        assert not hasattr(s, '__dict__')
+        assert s._tracker is None and s._stats_h is None
+        assert s.getsockopt(zmq.TYPE) == zmq.PAIR
+        s.setsockopt(zmq.LINGER, 0)
+        assert a.getsockopt(zmq.LINGER) == 0
+
+        s.start_read(lambda h, msg, err: None)
+        assert len(s._scheduler) == 1
+        s.close()
+        assert not len(s._scheduler)
+        loop.run()
@@ -7,11 +7,18 @@ Classes
 
 - ``ZMQ`` : :doc:`zmq` class
 - ``ZMQPoll`` : :doc:`poll` class
+- ``ZMQPollGroup`` : :doc:`poll` class
+- ``LoopPool`` : :doc:`pool` class
+- ``QueueFull``, ``MessageExpired``, ``RequestTimeout``,
+  ``RequestCancelled`` : :doc:`errors`
 
 """
 
 version_info = (0, 3, 1)
 __version__ = ".".join([str(v) for v in version_info])
 
-from uzmq.poll import ZMQPoll
+from uzmq.errors import (QueueFull, MessageExpired, RequestTimeout,
+        RequestCancelled)
+from uzmq.poll import ZMQPoll, ZMQPollGroup
+from uzmq.pool import LoopPool
 from uzmq.sock import ZMQ
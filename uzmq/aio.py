@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+AsyncZMQ: asyncio front end for ZMQ sockets
+
+The socket is watched with the asyncio loop itself: the fd returned by
+``getsockopt(zmq.FD)`` is registered with ``loop.add_reader`` and
+``zmq.EVENTS`` is re-checked each time it is signaled and after each
+send or receive, like the :doc:`zmq` does on the pyuv loop.
+
+Requires Python 3.7 or newer.
+"""
+import asyncio
+from collections import deque
+
+import zmq
+
+from . import util
+
+
+class AsyncZMQ(object):
+    """\
+        :param socket: zmq socket
+        :param loop: asyncio loop where this handle runs, the running
+            loop by default. It is required when the handle is created
+            outside of a running loop.
+
+        The AsyncZMQ handle provides coroutines to send and receive
+        multipart messages and can be used as an asynchronous iterator
+        over the incoming messages::
+
+            async for msg in AsyncZMQ(socket):
+                ...
+    """
+
+    def __init__(self, socket, loop=None):
+        if loop is None:
+            # raises RuntimeError outside of a running loop
+            loop = asyncio.get_running_loop()
+
+        self.loop = loop
+        self.socket = socket
+
+        self.fd = socket.getsockopt(zmq.FD)
+        self._recv_waiters = deque()
+        self._send_waiters = deque()
+        self._check_scheduled = False
+        self._closed = False
+
+        loop.add_reader(self.fd, self._check)
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if this handle is closed."""
+        return self._closed
+
+    async def recv_multipart(self, copy=True, track=False):
+        """
+        :param copy: bool
+            if copy is False, Frame objects are returned.
+        :param track: bool
+            Should the message be tracked for notification that ZMQ has
+            finished with it? (ignored if copy=True)
+
+        Receive a multipart message. See zmq.socket.recv_multipart for
+        details.
+        """
+        # don't overtake the coroutines already waiting
+        if self._recv_waiters:
+            await self._wait(self._recv_waiters)
+
+        while True:
+            try:
+                msg = self.socket.recv_multipart(zmq.NOBLOCK, copy=copy,
+                        track=track)
+            except zmq.ZMQError as e:
+                if e.errno != zmq.EAGAIN:
+                    raise
+            else:
+                self._schedule_check()
+                return msg
+
+            await self._wait(self._recv_waiters)
+
+    async def send_multipart(self, msg, flags=0, copy=True, track=False):
+        """
+        :param msg: list of str, bytes, buffers or Frame, the content
+            of the message. Only str frames are encoded.
+        :param flags: int
+            Any supported flag
+        :param copy: bool
+            Should the message be sent without copy?
+        :param track: bool
+            Should the message be tracked for notification that ZMQ has
+            finished with it? (ignored if copy=True)
+
+        Send a multipart message once the socket can accept it. See
+        zmq.socket.send_multipart for details.
+        """
+        msg = [util.to_frame(m) for m in msg]
+        flags |= zmq.NOBLOCK
+
+        if self._send_waiters:
+            await self._wait(self._send_waiters)
+
+        while True:
+            try:
+                status = self.socket.send_multipart(msg, flags=flags,
+                        copy=copy, track=track)
+            except zmq.ZMQError as e:
+                if e.errno != zmq.EAGAIN:
+                    raise
+            else:
+                self._schedule_check()
+                return status
+
+            await self._wait(self._send_waiters)
+
+    def close(self):
+        """ Stop watching the socket. Pending coroutines are cancelled.
+        The socket itself is not closed. """
+        if self._closed:
+            return
+
+        self._closed = True
+        self.loop.remove_reader(self.fd)
+
+        for waiters in (self._recv_waiters, self._send_waiters):
+            while waiters:
+                waiters.popleft().cancel()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+
+        try:
+            return await self.recv_multipart()
+        except asyncio.CancelledError:
+            if self._closed:
+                raise StopAsyncIteration
+            raise
+
+    async def _wait(self, waiters):
+        if self._closed:
+            raise zmq.ZMQError(zmq.ENOTSOCK)
+
+        fut = self.loop.create_future()
+        waiters.append(fut)
+
+        # the zmq fd is edge triggered, the socket may already be ready.
+        self._schedule_check()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut in waiters:
+                waiters.remove(fut)
+            elif fut.done() and not fut.cancelled():
+                # we were woken up, let the next waiter run instead
+                self._schedule_check()
+            raise
+
+    def _schedule_check(self):
+        if self._check_scheduled or self._closed:
+            return
+
+        self._check_scheduled = True
+        self.loop.call_soon(self._check)
+
+    def _check(self):
+        self._check_scheduled = False
+        if self._closed:
+            return
+
+        z_events = self.socket.getsockopt(zmq.EVENTS)
+
+        # wake the first waiter, it will schedule a new check once
+        # it's done so the next one can run.
+        if z_events & zmq.POLLIN:
+            self._wake(self._recv_waiters)
+
+        if z_events & zmq.POLLOUT:
+            self._wake(self._send_waiters)
+
+    def _wake(self, waiters):
+        while waiters:
+            fut = waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
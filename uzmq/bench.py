@@ -0,0 +1,506 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+Throughput and latency benchmarks
+
+Run them with::
+
+    $ python -m uzmq.bench --count 10000 --sizes 64,1024 > results.json
+
+Each case sends ``count`` messages of ``frames`` frames of ``size`` bytes
+over a pair of sockets and measures:
+
+- ``msgs_per_sec``: the receiving rate when the sender pipelines its
+  messages (REQ/REP can only do round trips),
+- ``p50_us`` / ``p99_us``: the latency of a message sent when the
+  previous one has been received. It's a round trip for REQ/REP and
+  DEALER/ROUTER (the server echoes the message) and the one way delay
+  for PUB/SUB and PUSH/PULL.
+
+The cases are run with the :doc:`zmq`, the :doc:`poll` and raw pyzmq
+blocking calls. Results are printed as a JSON list.
+
+The memory used by the handles is measured with::
+
+    $ python -m uzmq.bench --memory --handles 1000
+
+It reports the bytes allocated per handle, once created
+(``bytes_per_handle``) and once reading (``bytes_per_reading_handle``),
+not counting the sockets. It requires tracemalloc.
+"""
+
+import argparse
+import itertools
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pyuv
+import zmq
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from .poll import ZMQPoll
+from .sock import ZMQ, QUEUE_BLOCK
+from . import util
+
+# pattern name -> (sender type, receiver type, is a round trip)
+PATTERNS = {
+    "reqrep": (zmq.REQ, zmq.REP, True),
+    "pubsub": (zmq.PUB, zmq.SUB, False),
+    "pushpull": (zmq.PUSH, zmq.PULL, False),
+    "dealerrouter": (zmq.DEALER, zmq.ROUTER, True)
+}
+
+TRANSPORTS = ("inproc", "ipc", "tcp")
+
+# number of messages queued at once by the ZMQ handle benchmarks
+QUEUE_SIZE = 1000
+
+# number of messages received per batch by the ZMQ handle benchmarks
+READ_BATCH = 256
+
+clock = util.monotonic
+
+
+class BenchTimeout(Exception):
+    """ raised when a benchmark doesn't complete in time """
+
+
+class _Pair(object):
+    """ a connected pair of sockets for a pattern and a transport """
+
+    _endpoint_id = itertools.count()
+
+    def __init__(self, ctx, pattern, transport, tmpdir):
+        sender_type, receiver_type, self.echo = PATTERNS[pattern]
+        self.sender = ctx.socket(sender_type)
+        self.receiver = ctx.socket(receiver_type)
+
+        for s in (self.sender, self.receiver):
+            s.setsockopt(zmq.LINGER, 0)
+            # don't let PUB drop messages
+            s.setsockopt(zmq.SNDHWM, 0)
+            s.setsockopt(zmq.RCVHWM, 0)
+
+        if receiver_type == zmq.SUB:
+            self.receiver.setsockopt(zmq.SUBSCRIBE, b'')
+
+        # the sender binds, so a PUB socket gets the subscriptions
+        # before it starts sending.
+        if transport == "tcp":
+            port = self.sender.bind_to_random_port("tcp://127.0.0.1")
+            addr = "tcp://127.0.0.1:%s" % port
+        elif transport == "ipc":
+            addr = "ipc://%s/%s" % (tmpdir, next(self._endpoint_id))
+            self.sender.bind(addr)
+        else:
+            addr = "inproc://uzmq-bench-%s" % next(self._endpoint_id)
+            self.sender.bind(addr)
+
+        self.receiver.connect(addr)
+
+        # give the subscription time to reach the publisher
+        time.sleep(0.1)
+
+    def close(self):
+        self.sender.close()
+        self.receiver.close()
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[int(round(p * (len(values) - 1)))]
+
+
+def _run_loop(loop, timeout, handles):
+    def on_timeout(h):
+        state.append(True)
+        for handle in handles:
+            if not handle.closed:
+                handle.close()
+        h.close()
+
+    state = []
+    timer = pyuv.Timer(loop)
+    timer.start(on_timeout, timeout, 0.0)
+    # don't keep the loop alive once the handles are done
+    timer.ref = False
+    loop.run()
+    if not timer.closed:
+        timer.close()
+        loop.run()
+
+    if state:
+        raise BenchTimeout()
+
+
+# raw pyzmq
+
+def raw_pipeline(pair, msg, count, timeout):
+    def consume():
+        for i in range(count):
+            if not pair.receiver.poll(timeout * 1000):
+                return
+            pair.receiver.recv_multipart()
+        state.append(True)
+
+    state = []
+    t = threading.Thread(target=consume)
+    t.daemon = True
+    start = clock()
+    t.start()
+    for i in range(count):
+        pair.sender.send_multipart(msg)
+    t.join()
+    if not state:
+        raise BenchTimeout()
+    return clock() - start
+
+
+def raw_pingpong(pair, msg, count, timeout):
+    latencies = []
+    sender, receiver = pair.sender, pair.receiver
+    for i in range(count):
+        t0 = clock()
+        sender.send_multipart(msg)
+        m = receiver.recv_multipart()
+        if pair.echo:
+            receiver.send_multipart(m)
+            sender.recv_multipart()
+        latencies.append(clock() - t0)
+    return latencies
+
+
+# ZMQ handle
+
+def zmq_pipeline(pair, msg, count, timeout):
+    loop = pyuv.Loop()
+    sender = ZMQ(loop, pair.sender)
+    receiver = ZMQ(loop, pair.receiver)
+    state = {"sent": 0, "received": 0}
+
+    def fill(handle=None):
+        while state["sent"] < count and sender.queued_messages < QUEUE_SIZE:
+            sender.write_multipart(msg)
+            state["sent"] += 1
+
+    def on_read(handle, msgs, err):
+        state["received"] += len(msgs)
+        if state["received"] >= count:
+            sender.close()
+            receiver.close()
+
+    sender.set_queue_limit(max_messages=QUEUE_SIZE, policy=QUEUE_BLOCK,
+            on_drain=fill)
+    receiver.start_read(batch_callback=on_read, batch=READ_BATCH)
+
+    start = clock()
+    fill()
+    _run_loop(loop, timeout, [sender, receiver])
+    return clock() - start
+
+
+def zmq_pingpong(pair, msg, count, timeout):
+    loop = pyuv.Loop()
+    sender = ZMQ(loop, pair.sender)
+    receiver = ZMQ(loop, pair.receiver)
+    latencies = []
+    state = {}
+
+    def send():
+        state["t0"] = clock()
+        sender.write_multipart(msg)
+
+    def done(handle, m, err):
+        latencies.append(clock() - state["t0"])
+        if len(latencies) >= count:
+            sender.close()
+            receiver.close()
+        else:
+            send()
+
+    def echo(handle, m, err):
+        receiver.write_multipart(m)
+
+    if pair.echo:
+        receiver.start_read(echo)
+        sender.start_read(done)
+    else:
+        receiver.start_read(done)
+
+    send()
+    _run_loop(loop, timeout, [sender, receiver])
+    return latencies
+
+
+# ZMQPoll handle
+
+def poll_pipeline(pair, msg, count, timeout):
+    loop = pyuv.Loop()
+    sender = ZMQPoll(loop, pair.sender)
+    receiver = ZMQPoll(loop, pair.receiver)
+    state = {"sent": 0, "received": 0}
+
+    def on_writable(handle, events, errno):
+        while state["sent"] < count:
+            try:
+                pair.sender.send_multipart(msg, zmq.NOBLOCK)
+            except zmq.ZMQError as e:
+                if e.errno == zmq.EAGAIN:
+                    return
+                raise
+            state["sent"] += 1
+        handle.close()
+
+    def on_readable(handle, events, errno):
+        while True:
+            try:
+                pair.receiver.recv_multipart(zmq.NOBLOCK)
+            except zmq.ZMQError as e:
+                if e.errno == zmq.EAGAIN:
+                    break
+                raise
+            state["received"] += 1
+
+        if state["received"] >= count:
+            handle.close()
+
+    receiver.start(pyuv.UV_READABLE, on_readable)
+    sender.start(pyuv.UV_WRITABLE, on_writable)
+
+    start = clock()
+    _run_loop(loop, timeout, [sender, receiver])
+    return clock() - start
+
+
+def poll_pingpong(pair, msg, count, timeout):
+    loop = pyuv.Loop()
+    sender = ZMQPoll(loop, pair.sender)
+    receiver = ZMQPoll(loop, pair.receiver)
+    latencies = []
+    state = {}
+
+    def send():
+        state["t0"] = clock()
+        pair.sender.send_multipart(msg)
+
+    def done():
+        latencies.append(clock() - state["t0"])
+        if len(latencies) >= count:
+            sender.close()
+            receiver.close()
+        else:
+            send()
+
+    def on_receiver(handle, events, errno):
+        m = pair.receiver.recv_multipart()
+        if pair.echo:
+            pair.receiver.send_multipart(m)
+        else:
+            done()
+
+    def on_sender(handle, events, errno):
+        pair.sender.recv_multipart()
+        done()
+
+    receiver.start(pyuv.UV_READABLE, on_receiver)
+    if pair.echo:
+        sender.start(pyuv.UV_READABLE, on_sender)
+
+    send()
+    _run_loop(loop, timeout, [sender, receiver])
+    return latencies
+
+
+IMPLS = {
+    "raw": (raw_pipeline, raw_pingpong),
+    "zmq": (zmq_pipeline, zmq_pingpong),
+    "poll": (poll_pipeline, poll_pingpong)
+}
+
+
+def run_case(ctx, impl, pattern, transport, size, frames, count,
+        latency_count=1000, timeout=60.0, tmpdir=None):
+    """ run a benchmark case and return its result as a dict """
+    pipeline, pingpong = IMPLS[impl]
+    msg = [b'x' * size] * frames
+    latency_count = min(count, latency_count)
+
+    result = dict(impl=impl, pattern=pattern, transport=transport,
+            size=size, frames=frames, count=count)
+
+    try:
+        if PATTERNS[pattern][0] == zmq.REQ:
+            # REQ/REP can only do round trips
+            pair = _Pair(ctx, pattern, transport, tmpdir)
+            try:
+                latencies = pingpong(pair, msg, count, timeout)
+            finally:
+                pair.close()
+            elapsed = sum(latencies)
+        else:
+            pair = _Pair(ctx, pattern, transport, tmpdir)
+            try:
+                elapsed = pipeline(pair, msg, count, timeout)
+            finally:
+                pair.close()
+
+            pair = _Pair(ctx, pattern, transport, tmpdir)
+            try:
+                latencies = pingpong(pair, msg, latency_count, timeout)
+            finally:
+                pair.close()
+    except BenchTimeout:
+        result["error"] = "timeout"
+        return result
+
+    result["msgs_per_sec"] = count / elapsed
+    result["mb_per_sec"] = count * size * frames / elapsed / 1e6
+    result["p50_us"] = _percentile(latencies, 0.5) * 1e6
+    result["p99_us"] = _percentile(latencies, 0.99) * 1e6
+    return result
+
+
+# handle classes measured by the memory benchmark
+HANDLES = {
+    "zmq": ZMQ,
+    "poll": ZMQPoll
+}
+
+
+def _noop(*args):
+    pass
+
+
+def _start_reading(handle):
+    if isinstance(handle, ZMQ):
+        handle.start_read(_noop)
+    else:
+        handle.start(pyuv.UV_READABLE, _noop)
+
+
+def memory_case(impl, count):
+    """ measure the memory allocated by ``count`` handles and return the
+    result as a dict """
+    if tracemalloc is None:
+        raise RuntimeError("the memory benchmark requires tracemalloc")
+
+    handle_class = HANDLES[impl]
+    ctx = zmq.Context()
+    ctx.set(zmq.MAX_SOCKETS, count + 1)
+    loop = pyuv.Loop()
+    sockets = [ctx.socket(zmq.PULL) for i in range(count + 1)]
+    handles = []
+    try:
+        # the state shared by the handles of a loop isn't counted
+        handles.append(handle_class(loop, sockets[0]))
+        _start_reading(handles[0])
+
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            created = [handle_class(loop, s) for s in sockets[1:]]
+            idle = tracemalloc.get_traced_memory()[0] - start
+            for handle in created:
+                _start_reading(handle)
+            reading = tracemalloc.get_traced_memory()[0] - start
+        finally:
+            tracemalloc.stop()
+        handles.extend(created)
+    finally:
+        for handle in handles:
+            handle.close()
+        loop.run()
+        for s in sockets:
+            s.close(linger=0)
+        ctx.term()
+
+    return dict(impl=impl, handles=count,
+            bytes_per_handle=idle / float(count),
+            bytes_per_reading_handle=reading / float(count))
+
+
+def _list(type_):
+    def parse(value):
+        return [type_(v) for v in value.split(',') if v]
+    return parse
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m uzmq.bench",
+            description="uzmq throughput and latency benchmarks")
+    parser.add_argument("--impls", type=_list(str),
+            default=sorted(IMPLS), help="implementations to run")
+    parser.add_argument("--patterns", type=_list(str),
+            default=sorted(PATTERNS), help="socket patterns to run")
+    parser.add_argument("--transports", type=_list(str),
+            default=list(TRANSPORTS), help="transports to use")
+    parser.add_argument("--sizes", type=_list(int), default=[64, 4096],
+            help="frame sizes in bytes")
+    parser.add_argument("--frames", type=_list(int), default=[1, 3],
+            help="number of frames per message")
+    parser.add_argument("--count", type=int, default=10000,
+            help="number of messages sent by each case")
+    parser.add_argument("--latency-count", type=int, default=1000,
+            help="number of messages used to measure the latency")
+    parser.add_argument("--timeout", type=float, default=60.0,
+            help="maximum duration of a case in seconds")
+    parser.add_argument("--output", default=None,
+            help="file where the JSON results are written")
+    parser.add_argument("--memory", action="store_true",
+            help="measure the memory used per handle instead")
+    parser.add_argument("--handles", type=int, default=1000,
+            help="number of handles created by the memory benchmark")
+    opts = parser.parse_args(args)
+
+    for name, choices in (("impls", IMPLS), ("patterns", PATTERNS),
+            ("transports", TRANSPORTS)):
+        unknown = set(getattr(opts, name)) - set(choices)
+        if unknown:
+            parser.error("unknown %s: %s" % (name,
+                ", ".join(sorted(unknown))))
+
+    if opts.memory:
+        results = [memory_case(impl, opts.handles) for impl in opts.impls
+                if impl in HANDLES]
+        _output(results, opts.output)
+        return
+
+    ctx = zmq.Context()
+    tmpdir = tempfile.mkdtemp(prefix="uzmq-bench-")
+    results = []
+    try:
+        for case in itertools.product(opts.impls, opts.patterns,
+                opts.transports, opts.sizes, opts.frames):
+            result = run_case(ctx, *case, count=opts.count,
+                    latency_count=opts.latency_count, timeout=opts.timeout,
+                    tmpdir=tmpdir)
+            results.append(result)
+            sys.stderr.write("%s\n" % json.dumps(result, sort_keys=True))
+    finally:
+        ctx.term()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    _output(results, opts.output)
+
+
+def _output(results, path):
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+BufferPool: preallocated receive buffers
+
+"""
+from collections import deque
+
+
+class BufferPool(object):
+    """\
+        :param size: int, size in bytes of the buffers. Bigger frames
+            can't be received in them.
+        :param count: int, maximum number of free buffers kept by the
+            pool.
+
+        A ``BufferPool`` keeps ``bytearray`` buffers of the same size
+        so they can be reused to receive messages without allocating
+        new objects. See the ``pool`` argument of
+        :py:meth:`uzmq.sock.ZMQ.start_read`.
+
+        Buffers are handed out as ``memoryview`` objects of the
+        received data. They should be given back with
+        :py:meth:`release` once they are not used anymore, the pool
+        allocates new buffers otherwise.
+    """
+
+    def __init__(self, size=65536, count=64):
+        self.size = size
+        self.count = count
+        self._free = deque(bytearray(size) for i in range(count))
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self):
+        """ Return a free buffer. """
+        try:
+            return self._free.pop()
+        except IndexError:
+            return bytearray(self.size)
+
+    def release(self, *buffers):
+        """ Give back buffers, or views of buffers, to the pool. The
+        views are released and can't be used anymore. """
+        free = self._free
+        for buf in buffers:
+            if isinstance(buf, memoryview):
+                view, buf = buf, buf.obj
+                view.release()
+
+            if (isinstance(buf, bytearray) and len(buf) == self.size and
+                    len(free) < self.count):
+                free.append(buf)
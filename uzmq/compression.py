@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+Compression of the frames of the messages
+
+The frames bigger than a threshold are compressed. When at least one
+frame of a message is compressed, a flag frame is appended to it::
+
+    FLAG_MAGIC + codec id + bitmap of the compressed frames
+
+The receiving handle removes the flag frame and decompresses the
+frames, with the codec given by its id.
+
+``zlib`` is always available, ``lz4`` and ``zstd`` when the lz4 or
+zstandard packages are installed.
+"""
+import struct
+import zlib
+
+from . import util
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FLAG_MAGIC = b'\xffUZC'
+
+# frames smaller than this size are sent as is
+THRESHOLD = 1024
+
+_codecs = {}
+_codecs_by_id = {}
+
+
+class _Codec(object):
+
+    __slots__ = ('name', 'id', 'compress', 'decompress')
+
+    def __init__(self, name, id, compress, decompress):
+        self.name = name
+        self.id = id
+        self.compress = compress
+        self.decompress = decompress
+
+
+def register(name, id, compress, decompress):
+    """\
+        :param name: str, name of the codec
+        :param id: int, id of the codec on the wire, from 0 to 255.
+        :param compress: callable, ``compress(data, level)`` returning
+            the compressed bytes. ``level`` is None for the default
+            level of the codec.
+        :param decompress: callable, ``decompress(data)``.
+
+        Register a compression codec.
+    """
+    if not (util.is_callable(compress) and util.is_callable(decompress)):
+        raise TypeError("a callable is required")
+
+    codec = _Codec(name, id, compress, decompress)
+    _codecs[name] = codec
+    _codecs_by_id[id] = codec
+
+
+def _zlib_compress(data, level):
+    if level is None:
+        level = 6
+    return zlib.compress(data, level)
+
+
+def _lz4_compress(data, level):
+    return lz4.frame.compress(data, compression_level=level or 0)
+
+
+def _zstd_compress(data, level):
+    return zstandard.ZstdCompressor(level=level or 3).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+register('zlib', 1, _zlib_compress, zlib.decompress)
+if lz4 is not None:
+    register('lz4', 2, _lz4_compress, lz4.frame.decompress)
+if zstandard is not None:
+    register('zstd', 3, _zstd_compress, _zstd_decompress)
+
+
+class Compressor(object):
+    """\
+        :param codec: str, name of a registered codec.
+        :param threshold: int
+            Frames smaller than this size in bytes are not compressed.
+        :param level: int, compression level, the default level of the
+            codec if None.
+        :param executor: a ``concurrent.futures`` executor used by the
+            :doc:`zmq` to compress the messages, or None to compress
+            them on the loop.
+        :param skip: int, number of leading frames never compressed,
+            like the topic frame of the messages of PUB sockets that
+            subscribers filter on.
+
+        Compresses and decompresses the frames of messages.
+    """
+
+    def __init__(self, codec='zlib', threshold=THRESHOLD, level=None,
+            executor=None, skip=0):
+        try:
+            self.codec = _codecs[codec]
+        except KeyError:
+            raise ValueError("unknown compression codec: %r" % codec)
+
+        self.threshold = threshold
+        self.level = level
+        self.executor = executor
+        self.skip = skip
+
+    def wants(self, msg):
+        """ Return True if some frames of the message are big enough
+        to be compressed. """
+        threshold = self.threshold
+        return any(util.frame_size(f) >= threshold
+                for f in msg[self.skip:])
+
+    def compress(self, msg):
+        """ Return the frames to send for the message, the message
+        itself if no frame was compressed. """
+        threshold = self.threshold
+        frames = None
+        bitmap = bytearray((len(msg) + 7) // 8)
+        for i in range(self.skip, len(msg)):
+            frame = msg[i]
+            size = util.frame_size(frame)
+            if size < threshold:
+                continue
+
+            data = self.codec.compress(util.frame_buffer(frame), self.level)
+            if len(data) >= size:
+                # not compressible
+                continue
+
+            if frames is None:
+                frames = list(msg)
+            frames[i] = data
+            bitmap[i // 8] |= 1 << (i % 8)
+
+        if frames is None:
+            return msg
+
+        frames.append(FLAG_MAGIC + struct.pack('B', self.codec.id) +
+                bytes(bitmap))
+        return frames
+
+    def decompress(self, msg):
+        """ Return the original frames of a received message. """
+        return decompress(msg)
+
+
+def decompress(msg):
+    """ Return the original frames of a message, decompressing the
+    frames listed by its flag frame if it has one. """
+    if len(msg) < 2:
+        return msg
+
+    # the frames may be bytes, zmq.Frame or buffers like the
+    # memoryview objects of a BufferPool.
+    flag = util.frame_buffer(msg[-1])
+    start = len(FLAG_MAGIC)
+    if len(flag) < start + 1 or bytes(flag[:start]) != FLAG_MAGIC:
+        return msg
+
+    flag = bytes(flag)
+    codec_id = struct.unpack('B', flag[start:start + 1])[0]
+    try:
+        codec = _codecs_by_id[codec_id]
+    except KeyError:
+        raise ValueError("unknown compression codec id: %s" % codec_id)
+
+    bitmap = bytearray(flag[start + 1:])
+    frames = list(msg[:-1])
+    for i in range(min(len(frames), len(bitmap) * 8)):
+        if bitmap[i // 8] & (1 << (i % 8)):
+            frames[i] = codec.decompress(util.frame_buffer(frames[i]))
+    return frames
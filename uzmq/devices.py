@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+Devices: proxies running on the loop
+
+Loop based equivalents of ``zmq.proxy`` and the zmq devices, so
+brokers can share a loop with other handles instead of blocking a
+thread each.
+"""
+import zmq
+
+from .sock import ZMQ, QUEUE_BLOCK, QUEUE_DROP_NEWEST
+
+# number of messages forwarded each time a socket is readable
+BATCH = 256
+
+# number of messages waiting on a side before the other side is paused
+MAX_QUEUE = 1000
+
+
+class Proxy(object):
+    """\
+        :param loop: loop object where this device runs.
+        :param frontend: zmq socket
+        :param backend: zmq socket
+        :param capture: zmq socket. If set, all the forwarded messages
+            are also sent to it.
+        :param batch: int
+            Maximum number of messages forwarded each time a socket is
+            readable.
+        :param max_queue: int
+            Maximum number of messages waiting to be sent on a side.
+            Reading from the other side is paused when it's reached,
+            until the queue has been drained.
+
+        A ``Proxy`` forwards the multipart messages received on the
+        frontend to the backend and the messages received on the
+        backend to the frontend, like ``zmq.proxy``. The frames are
+        received and sent without being copied.
+
+        Messages sent to the capture socket are dropped instead of
+        pausing the proxy when it can't keep up.
+
+        The sockets are not closed with the device.
+
+        .. py:attribute:: frontend
+
+            *Read only*
+
+            :doc:`zmq` of the frontend socket.
+
+        .. py:attribute:: backend
+
+            *Read only*
+
+            :doc:`zmq` of the backend socket.
+
+        .. py:attribute:: capture
+
+            *Read only*
+
+            :doc:`zmq` of the capture socket or None.
+    """
+
+    def __init__(self, loop, frontend, backend, capture=None, batch=BATCH,
+            max_queue=MAX_QUEUE):
+        self.loop = loop
+        self.batch = batch
+        self.max_queue = max_queue
+
+        self.frontend = ZMQ(loop, frontend)
+        self.backend = ZMQ(loop, backend)
+        if capture is not None:
+            self.capture = ZMQ(loop, capture)
+            self.capture.set_queue_limit(max_messages=max_queue,
+                    policy=QUEUE_DROP_NEWEST)
+        else:
+            self.capture = None
+
+        self._routes = [(self.frontend, self.backend)]
+        if self._bidirectional():
+            self._routes.append((self.backend, self.frontend))
+
+        for src, dst in self._routes:
+            # pause the source while the destination can't keep up
+            dst.set_queue_limit(max_messages=max_queue, policy=QUEUE_BLOCK,
+                    on_high_water=lambda h, src=src: src.stop_read(),
+                    on_drain=lambda h, src=src, dst=dst: self._read(src,
+                        dst))
+
+        self._active = False
+
+    @property
+    def active(self):
+        """*Read only*
+
+            Indicates if the device is forwarding messages."""
+        return self._active
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if the device is closed."""
+        return self.frontend.closed
+
+    def start(self):
+        """ Start forwarding messages. """
+        self._active = True
+        for src, dst in self._routes:
+            self._read(src, dst)
+
+    def stop(self):
+        """ Stop forwarding messages. The messages already received are
+        still sent. """
+        self._active = False
+        for src, dst in self._routes:
+            src.stop_read()
+
+    def close(self):
+        """ Close the handles of the device. Messages not sent yet are
+        lost. """
+        self._active = False
+        for handle in (self.frontend, self.backend, self.capture):
+            if handle is not None and not handle.closed:
+                handle.close()
+
+    def _bidirectional(self):
+        return True
+
+    def _read(self, src, dst):
+        if not self._active:
+            return
+
+        capture = self.capture
+        def forward(handle, msgs, err):
+            if msgs is None:
+                # receive error, already logged by the handle
+                return
+
+            for msg in msgs:
+                dst.write_multipart(msg, copy=False)
+                if capture is not None:
+                    capture.write_multipart(msg, copy=False)
+
+        src.start_read(batch_callback=forward, batch=self.batch, copy=False)
+
+
+class Forwarder(Proxy):
+    """\
+        A ``Proxy`` between a SUB or XSUB frontend and a PUB or XPUB
+        backend. Messages are forwarded from the frontend to the
+        backend, and subscriptions from the backend to the frontend
+        when it's an XPUB socket.
+
+        A SUB frontend must be subscribed to the topics to forward.
+        See :py:class:`Proxy` for the arguments.
+    """
+
+    def _bidirectional(self):
+        return self.backend.getsockopt(zmq.TYPE) == zmq.XPUB
+
+
+class Streamer(Proxy):
+    """\
+        A ``Proxy`` forwarding messages from a PULL frontend to a PUSH
+        backend only. See :py:class:`Proxy` for the arguments.
+    """
+
+    def _bidirectional(self):
+        return False
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+uzmq exceptions
+
+"""
+
+
+class QueueFull(Exception):
+    """ raised, or passed to the write callback of a dropped message, when
+    the send queue of a :doc:`zmq` is full. """
+
+
+class MessageExpired(Exception):
+    """ passed to the write callback of a message dropped from the send
+    queue of a :doc:`zmq` because its time to live expired. """
+
+
+class RequestTimeout(Exception):
+    """ passed to the callback of a request of a :py:class:`uzmq.rpc.Client`
+    which didn't get its reply in time. """
+
+
+class RequestCancelled(Exception):
+    """ passed to the callback of a request still waiting for its reply
+    when its :py:class:`uzmq.rpc.Client` is closed. """
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+Patterns: load balancing broker and its workers
+
+Workers connect a DEALER socket to the backend ROUTER of the
+:py:class:`Broker` and exchange these messages with it, the first frame
+being the command:
+
+- ``[READY, capacity]``: sent by the worker when it starts. The
+  capacity frame is optional and gives the number of requests the
+  worker can handle at once.
+- ``[REQUEST, envelope..., b'', payload...]``: a request sent to the
+  worker. The envelope identifies the client and must be sent back with
+  the reply.
+- ``[REPLY, envelope..., b'', payload...]``: a reply sent by the worker.
+- ``[HEARTBEAT]``: sent by the broker to each worker at every heartbeat
+  interval. The worker answers with a heartbeat.
+- ``[DISCONNECT]``: sent by a worker leaving the broker.
+
+Clients are REQ sockets, or DEALER sockets sending an empty delimiter
+frame before the request, connected to the frontend ROUTER of the
+broker.
+"""
+from collections import deque, OrderedDict
+
+from .sock import ZMQ, QUEUE_BLOCK
+from .timers import get_timer_wheel
+from . import util
+
+READY = b'\x01'
+REQUEST = b'\x02'
+REPLY = b'\x03'
+HEARTBEAT = b'\x04'
+DISCONNECT = b'\x05'
+
+# number of messages received each time a socket is readable
+BATCH = 256
+
+
+def _split(msg):
+    """ split a message in envelope, delimiter included, and payload """
+    for i, frame in enumerate(msg):
+        if not frame:
+            return msg[:i + 1], msg[i + 1:]
+    return None, msg
+
+
+class _Worker(object):
+
+    __slots__ = ('id', 'capacity', 'inflight', 'expiry')
+
+    def __init__(self, id, capacity, expiry):
+        self.id = id
+        self.capacity = capacity
+        self.inflight = 0
+        self.expiry = expiry
+
+
+class Broker(object):
+    """\
+        :param loop: loop object where this broker runs.
+        :param frontend: zmq ROUTER socket the clients connect to.
+        :param backend: zmq ROUTER socket the workers connect to.
+        :param max_inflight: int
+            Number of requests sent at once to a worker that didn't
+            give its capacity.
+        :param heartbeat_interval: float
+            Interval in seconds between two heartbeats.
+        :param heartbeat_liveness: int
+            Number of heartbeats a worker can miss before it is
+            evicted.
+        :param max_pending: int
+            Maximum number of requests waiting for a worker. Reading
+            from the frontend is paused when it's reached. None for no
+            limit.
+        :param wheel: :py:class:`uzmq.timers.TimerWheel` running the
+            heartbeats. By default the wheel shared by the handles of
+            the loop is used.
+
+        A ``Broker`` dispatches the requests received on the frontend
+        to the ready workers in least recently used order, and the
+        replies of the workers back to the clients. Requests wait in a
+        queue while no worker is ready.
+
+        Workers which aren't heard from for ``heartbeat_interval *
+        heartbeat_liveness`` seconds are evicted. The requests they were
+        handling are lost.
+
+        .. py:attribute:: frontend
+
+            *Read only*
+
+            :doc:`zmq` of the frontend socket.
+
+        .. py:attribute:: backend
+
+            *Read only*
+
+            :doc:`zmq` of the backend socket.
+    """
+
+    def __init__(self, loop, frontend, backend, max_inflight=1,
+            heartbeat_interval=1.0, heartbeat_liveness=3, max_pending=None,
+            wheel=None):
+        self.loop = loop
+        self.wheel = wheel or get_timer_wheel(loop)
+        self.max_inflight = max_inflight
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_liveness = heartbeat_liveness
+        self.max_pending = max_pending
+
+        self.frontend = ZMQ(loop, frontend)
+        self.backend = ZMQ(loop, backend)
+        # the workers are never waited for, their messages are queued
+        self.backend.set_queue_limit(policy=QUEUE_BLOCK)
+
+        # workers by id, the least recently heard from first
+        self._workers = OrderedDict()
+        # workers able to take a request, the least recently used first
+        self._ready = OrderedDict()
+        self._pending = deque()
+        self._heartbeat = None
+        self._active = False
+        self._reading = False
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if the broker is closed."""
+        return self.frontend.closed
+
+    @property
+    def workers(self):
+        """*Read only*
+
+            Number of connected workers."""
+        return len(self._workers)
+
+    @property
+    def ready(self):
+        """*Read only*
+
+            Number of workers able to take a request."""
+        return len(self._ready)
+
+    @property
+    def pending(self):
+        """*Read only*
+
+            Number of requests waiting for a worker."""
+        return len(self._pending)
+
+    def start(self):
+        """ Start dispatching the requests. """
+        self._active = True
+        self.backend.start_read(batch_callback=self._on_backend,
+                batch=BATCH)
+        self._read_frontend()
+        self._schedule_heartbeat()
+
+    def stop(self):
+        """ Stop receiving requests and replies. """
+        self._active = self._reading = False
+        self.frontend.stop_read()
+        self.backend.stop_read()
+        self._cancel_heartbeat()
+
+    def close(self):
+        """ Close the handles of the broker. The sockets are not
+        closed. """
+        self._active = self._reading = False
+        self._cancel_heartbeat()
+        for handle in (self.frontend, self.backend):
+            if not handle.closed:
+                handle.close()
+
+    def _read_frontend(self):
+        self._reading = True
+        self.frontend.start_read(batch_callback=self._on_frontend,
+                batch=BATCH)
+
+    def _on_frontend(self, handle, msgs, err):
+        if msgs is None:
+            # receive error, already logged by the handle
+            return
+
+        pending = self._pending
+        for msg in msgs:
+            if _split(msg)[0] is None:
+                # no delimiter, we couldn't route the reply
+                continue
+            pending.append(msg)
+
+        self._dispatch()
+
+        if (self.max_pending is not None and
+                len(pending) >= self.max_pending):
+            self._reading = False
+            self.frontend.stop_read()
+
+    def _on_backend(self, handle, msgs, err):
+        if msgs is None:
+            # receive error, already logged by the handle
+            return
+
+        for msg in msgs:
+            if len(msg) < 2:
+                continue
+
+            wid, command = msg[0], msg[1]
+            if command == REPLY:
+                self.frontend.write_multipart(msg[2:])
+                worker = self._seen(wid)
+                if worker is not None and worker.inflight:
+                    worker.inflight -= 1
+                    if worker.inflight < worker.capacity:
+                        self._ready[wid] = worker
+            elif command == HEARTBEAT:
+                self._seen(wid)
+            elif command == READY:
+                capacity = self.max_inflight
+                if len(msg) > 2:
+                    capacity = int(msg[2])
+                self._add(wid, capacity)
+            elif command == DISCONNECT:
+                self._remove(wid)
+
+        self._dispatch()
+
+    def _add(self, wid, capacity):
+        self._remove(wid)
+        worker = _Worker(wid, capacity, self._expiry())
+        self._workers[wid] = worker
+        if capacity > 0:
+            self._ready[wid] = worker
+
+    def _remove(self, wid):
+        self._workers.pop(wid, None)
+        self._ready.pop(wid, None)
+
+    def _seen(self, wid):
+        worker = self._workers.pop(wid, None)
+        if worker is not None:
+            worker.expiry = self._expiry()
+            self._workers[wid] = worker
+        return worker
+
+    def _expiry(self):
+        return (util.monotonic() +
+                self.heartbeat_interval * self.heartbeat_liveness)
+
+    def _dispatch(self):
+        pending, ready = self._pending, self._ready
+        while pending and ready:
+            wid, worker = ready.popitem(last=False)
+            self.backend.write_multipart([wid, REQUEST] + pending.popleft())
+
+            worker.inflight += 1
+            if worker.inflight < worker.capacity:
+                # back at the end of the ready list
+                ready[wid] = worker
+
+        if (self._active and not self._reading and
+                len(pending) < self.max_pending):
+            self._read_frontend()
+
+    def _schedule_heartbeat(self):
+        self._cancel_heartbeat()
+        self._heartbeat = self.wheel.schedule(self.heartbeat_interval,
+                self._on_heartbeat)
+
+    def _cancel_heartbeat(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    def _on_heartbeat(self):
+        # the workers are ordered by expiry, only the expired ones are
+        # visited.
+        now = util.monotonic()
+        workers = self._workers
+        while workers:
+            wid = next(iter(workers))
+            if workers[wid].expiry > now:
+                break
+            self._remove(wid)
+
+        for wid in workers:
+            self.backend.write_multipart([wid, HEARTBEAT])
+
+        self._schedule_heartbeat()
+
+
+class Worker(object):
+    """\
+        :param loop: loop object where this worker runs.
+        :param socket: zmq DEALER socket connected to the backend of a
+            :py:class:`Broker`.
+        :param handler: callable
+            Function called with each request.
+        :param capacity: int
+            Number of requests the broker can send at once.
+
+        Handler signature: ``handler(worker, envelope, payload)``.
+
+        The reply to a request is sent with :py:meth:`reply`, or is the
+        list of frames returned by the handler.
+
+        .. py:attribute:: handle
+
+            *Read only*
+
+            :doc:`zmq` of the socket.
+    """
+
+    def __init__(self, loop, socket, handler, capacity=1):
+        if not util.is_callable(handler):
+            raise TypeError("a callable is required")
+
+        self.loop = loop
+        self.handler = handler
+        self.capacity = capacity
+        self.handle = ZMQ(loop, socket)
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if the worker is closed."""
+        return self.handle.closed
+
+    def start(self):
+        """ Announce the worker to the broker and handle its requests. """
+        self.handle.start_read(batch_callback=self._on_read, batch=BATCH)
+        self.handle.write_multipart([READY,
+            str(self.capacity).encode('ascii')])
+
+    def reply(self, envelope, payload):
+        """ Send the reply to a request. """
+        self.handle.write_multipart([REPLY] + list(envelope) +
+                list(payload))
+
+    def close(self):
+        """ Tell the broker the worker is leaving and close its handle.
+        """
+        if self.handle.closed:
+            return
+        self.handle.write_multipart([DISCONNECT])
+        self.handle.flush()
+        self.handle.close()
+
+    def _on_read(self, handle, msgs, err):
+        if msgs is None:
+            # receive error, already logged by the handle
+            return
+
+        for msg in msgs:
+            command = msg[0]
+            if command == REQUEST:
+                envelope, payload = _split(msg[1:])
+                reply = self.handler(self, envelope, payload)
+                if reply is not None:
+                    self.reply(envelope, reply)
+            elif command == HEARTBEAT:
+                handle.write_multipart([HEARTBEAT])
@@ -6,21 +6,215 @@
 ZMQPoll: ZMQ Poll handle
 
 """
+from collections import deque
+
 import pyuv
 import zmq
 
 from . import util
 
+
+class _PollEntry(object):
+
+    __slots__ = ('socket', 'poll_h', 'z_events', 'callback', 'scheduled')
+
+    def __init__(self, socket, poll_h, z_events, callback):
+        self.socket = socket
+        self.poll_h = poll_h
+        self.z_events = z_events
+        self.callback = callback
+        self.scheduled = False
+
+
+class ZMQPollGroup(object):
+    """\
+    :param loop: loop object where this group runs.
+
+    A ``ZMQPollGroup`` watches many ZMQ sockets at once. The file
+    descriptor of each socket is handed to the loop, and the sockets
+    signaled during a loop iteration are collected in a ready list that
+    is dispatched in one pass right after I/O polling, so the cost of an
+    iteration depends on the number of ready sockets only.
+
+    Callback signature: ``callback(socket, events, errorno)``.
+
+    .. py:attribute:: loop
+
+        *Read only*
+
+        :py:class:`pyuv.Loop` object where this group runs.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+
+        self._entries = {}
+        self._ready = deque()
+        self._check_h = pyuv.Check(loop)
+        self._idle_h = pyuv.Idle(loop)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, socket):
+        return socket in self._entries
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if this group is closing or already closed."""
+        return self._check_h.closed
+
+    def register(self, socket, events, callback):
+        """\
+        :param socket: zmq socket to watch
+        :param events: int
+            Mask of events that will be detected. The possible
+            events are `pyuv.UV_READABLE` or `pyuv.UV_WRITABLE`.
+        :param callback: callable
+            Function that will be called when the socket is ready.
+
+        Register a socket in the group.
+        """
+        if not util.is_callable(callback):
+            raise TypeError("a callable is required")
+
+        if socket in self._entries:
+            raise ValueError("socket already registered")
+
+        poll_h = pyuv.Poll(self.loop, socket.getsockopt(zmq.FD))
+        entry = _PollEntry(socket, poll_h, util.uv_to_zmq_events(events),
+                callback)
+        self._entries[socket] = entry
+
+        poll_h.start(pyuv.UV_READABLE,
+                lambda h, ev, errno: self._on_events(entry, errno))
+        if not self._check_h.active:
+            self._check_h.start(self._on_check)
+
+        # the zmq fd is edge triggered, events may already be pending.
+        self._schedule(entry)
+
+    def modify(self, socket, events, callback=None):
+        """ Update the event mask and optionally the callback of a
+        registered socket. """
+        entry = self._entries[socket]
+        entry.z_events = util.uv_to_zmq_events(events)
+        if callback is not None:
+            if not util.is_callable(callback):
+                raise TypeError("a callable is required")
+            entry.callback = callback
+
+        self._schedule(entry)
+
+    def unregister(self, socket):
+        """ Stop watching a socket. """
+        entry = self._entries.pop(socket, None)
+        if entry is None:
+            return
+
+        entry.poll_h.close()
+        entry.poll_h = None
+
+        if not self._entries:
+            self._check_h.stop()
+            self._idle_h.stop()
+            self._ready.clear()
+
+    def close(self, callback=None):
+        """
+        :param callable callback: Function that will be called after the
+            group is closed.
+
+        Unregister all the sockets and close the group.
+        """
+        for socket in list(self._entries):
+            self.unregister(socket)
+
+        self._check_h.close()
+        self._idle_h.close()
+
+        if util.is_callable(callback):
+            callback(self)
+
+    def _schedule(self, entry):
+        if entry.scheduled:
+            return
+
+        entry.scheduled = True
+        self._ready.append(entry)
+
+        # make sure the loop doesn't block until the ready list is
+        # processed.
+        if not self._idle_h.active:
+            self._idle_h.start(self._on_idle)
+
+    def _on_idle(self, handle):
+        pass
+
+    def _on_events(self, entry, errno):
+        if errno:
+            entry.callback(entry.socket, 0, errno)
+            return
+
+        self._schedule(entry)
+
+    def _on_check(self, handle):
+        ready, self._ready = self._ready, deque()
+
+        for entry in ready:
+            entry.scheduled = False
+            if entry.poll_h is not None:
+                self._dispatch(entry)
+
+        if not self._ready and not self._idle_h.closed:
+            self._idle_h.stop()
+
+    def _dispatch(self, entry):
+        try:
+            z_events = entry.socket.getsockopt(zmq.EVENTS)
+        except zmq.ZMQError as e:
+            entry.callback(entry.socket, 0, e.errno)
+            return
+
+        z_events &= entry.z_events
+        if not z_events:
+            return
+
+        entry.callback(entry.socket, util.zmq_to_uv_events(z_events), 0)
+
+        # the fd won't be signaled again for the events left unhandled
+        # by the callback, so check them again on the next iteration.
+        if entry.poll_h is not None:
+            self._schedule(entry)
+
+
+def get_poll_group(loop):
+    """ return the :py:class:`ZMQPollGroup` shared by the ``ZMQPoll``
+    handles of this loop. """
+    return util.loop_local(loop, 'poll_group', ZMQPollGroup)
+
+
 class ZMQPoll(object):
     """\
     :param loop: loop object where this handle runs (accessible
         through :py:attr:`Poll.loop`).
     :param int socket: zmq socket
         to be monitored for readibility or writability.
+    :param group: :py:class:`ZMQPollGroup` used to watch the socket.
+        By default the group shared by all the handles of the loop is
+        used.
 
     ``ZMQPoll`` ZMQPoll handles can be used to monitor any ZMQ
     sockets for readability or writability.
 
+    By default the handle is event driven: it watches the file
+    descriptor returned by ``getsockopt(zmq.FD)`` and re-checks
+    ``zmq.EVENTS`` each time it is signaled, so an idle handle doesn't
+    cost anything. Passing a positive ``timeout`` to :py:meth:`start`
+    falls back to polling the socket periodically.
+
     .. py:attribute:: loop
 
         *Read only*
@@ -29,29 +223,36 @@ class ZMQPoll(object):
 
     """
 
-    def __init__(self, loop, socket):
+    __slots__ = ('loop', 'socket', '_group', '_timer_h', '_poller',
+            '_callback', '_closed')
+
+    def __init__(self, loop, socket, group=None):
         self.loop = loop
         self.socket = socket
 
         # initialize private variable
-        self._timer_h = pyuv.Timer(loop)
-        self._poller = zmq.Poller()
+        self._group = group
+        # the timer is only created to poll the socket periodically
+        self._timer_h = None
+        self._poller = None
         self._callback = None
-        self._started = False
+        self._closed = False
 
     @property
     def active(self):
         """*Read only*
 
             Indicates if this handle is active."""
-        return self._timer_h.active
+        if self._timer_h is not None and self._timer_h.active:
+            return True
+        return self._group is not None and self.socket in self._group
 
     @property
     def closed(self):
         """*Read only*
 
             Indicates if this handle is closing or already closed."""
-        return self._timer_h.closed
+        return self._closed
 
     def start(self, events, callback, timeout=-1):
         """\
@@ -64,7 +265,9 @@ class ZMQPoll(object):
             receives events.
 
         :param timeout: int
-            Timeoout between each poll.
+            Timeoout between each poll. If None or negative (the
+            default) the handle is driven by the socket events instead
+            of a timer.
 
         Callback signature: ``callback(poll_handle, events, errorno)``.
 
@@ -73,32 +276,38 @@ class ZMQPoll(object):
         if not util.is_callable(callback):
             raise TypeError("a callable is required")
 
-        if timeout is None or timeout<0:
-            timeout = 0.01
-
         self._callback = callback
 
-        z_events = 0
-        if events & pyuv.UV_READABLE:
-            z_events |= zmq.POLLIN
-
-        if events & pyuv.UV_WRITABLE:
-            z_events |= zmq.POLLOUT
+        if timeout is None or timeout<0:
+            self._stop_timer()
 
+            if self._group is None:
+                self._group = get_poll_group(self.loop)
 
-        if self._timer_h.active:
-            self._timer.stop()
-            self._poller.modify(self.socket, z_events)
+            if self.socket in self._group:
+                self._group.modify(self.socket, events)
+            else:
+                self._group.register(self.socket, events, self._on_events)
         else:
-            self._poller.register(self.socket, z_events)
+            self._unregister()
+
+            z_events = util.uv_to_zmq_events(events)
+            if self._timer_h is None:
+                self._timer_h = pyuv.Timer(self.loop)
 
-        self._timer_h.start(self._on_timeout, timeout, timeout)
+            if self._poller is None:
+                self._poller = zmq.Poller()
+                self._poller.register(self.socket, z_events)
+            else:
+                self._timer_h.stop()
+                self._poller.modify(self.socket, z_events)
 
+            self._timer_h.start(self._on_timeout, timeout, timeout)
 
     def stop(self):
         """ Stop the ``Poll`` handle. """
-        self._timer_h.stop()
-        self._poller.unregister(self.socket)
+        self._unregister()
+        self._stop_timer()
 
     def close(self, callback=None):
         """
@@ -108,12 +317,28 @@ class ZMQPoll(object):
         Close the ``ZMQPoll`` handle. After a handle has been closed no other
         operations can be performed on it.
         """
-        self._timer_h.close()
-        self._poller.unregister(self.socket)
+        self.stop()
+        if self._timer_h is not None:
+            self._timer_h.close()
+        self._closed = True
 
         if util.is_callable(callback):
             callback(self)
 
+    def _unregister(self):
+        if self._group is not None:
+            self._group.unregister(self.socket)
+
+    def _stop_timer(self):
+        if self._timer_h is not None:
+            self._timer_h.stop()
+        if self._poller is not None:
+            self._poller.unregister(self.socket)
+            self._poller = None
+
+    def _on_events(self, socket, events, errno):
+        self._callback(self, events, errno)
+
     def _on_timeout(self, handle):
         # trick to use the last state. Fix a race condition
 
@@ -123,11 +348,4 @@ class ZMQPoll(object):
             return
 
         for fd, evt in z_events:
-            events = 0
-            if evt & zmq.POLLIN:
-                events |= pyuv.UV_READABLE
-
-            if evt & zmq.POLLOUT:
-                events |= pyuv.UV_WRITABLE
-
-            self._callback(self, events, errno)
+            self._callback(self, util.zmq_to_uv_events(evt), errno)
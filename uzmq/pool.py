@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+LoopPool: ZMQ handles sharded over several loops
+
+"""
+import itertools
+import threading
+
+import pyuv
+
+from .sock import ZMQ
+from . import util
+
+
+class _LoopWorker(object):
+    """ a loop running in its own thread, with a queue of functions to
+    call on it """
+
+    def __init__(self, index):
+        self.loop = pyuv.Loop()
+        self.name = "uzmq-loop-%s" % index
+        self.thread = None
+
+        self._calls = None
+        self._open_calls()
+
+    @property
+    def in_thread(self):
+        return threading.current_thread() is self.thread
+
+    def start(self):
+        if self._calls.closed:
+            self._open_calls()
+
+        self.thread = threading.Thread(target=self.loop.run, name=self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def call(self, fn, *args, **kwargs):
+        self._calls.call(fn, *args, **kwargs)
+
+    def call_wait(self, fn, *args, **kwargs):
+        """ call a function on the loop and wait for its result """
+        if self.thread is None or self.in_thread:
+            return fn(*args, **kwargs)
+
+        done = threading.Event()
+        res = []
+        def wrapper():
+            try:
+                res.append((fn(*args, **kwargs), None))
+            except Exception as e:
+                res.append((None, e))
+            done.set()
+
+        self.call(wrapper)
+        done.wait()
+        result, error = res[0]
+        if error is not None:
+            raise error
+        return result
+
+    def stop(self):
+        self.call(self._close_all)
+        self.thread.join()
+        self.thread = None
+
+    def _open_calls(self):
+        self._calls = util.call_queue(self.loop)
+        # keep the loop running until the pool is stopped
+        self._calls.ref = True
+
+    def _close_all(self):
+        for handle in list(self.loop.handles):
+            if not handle.closed:
+                handle.close()
+
+
+class LoopPool(object):
+    """\
+        :param size: int, number of loops. One by cpu by default.
+
+        A ``LoopPool`` runs ``size`` pyuv loops, each in its own thread,
+        and spreads :doc:`zmq` handles over them so the dispatching of
+        many sockets can use several cores (pyzmq releases the GIL while
+        sending and receiving).
+
+        Handles must only be used from the thread of their loop. Use
+        :py:meth:`call` or :py:meth:`write` to use them from other
+        threads. Callbacks of a handle run in the thread of its loop.
+
+        .. py:attribute:: loops
+
+            *Read only*
+
+            List of the :py:class:`pyuv.Loop` objects of the pool.
+    """
+
+    def __init__(self, size=None):
+        if size is None:
+            size = _cpu_count()
+
+        if size < 1:
+            raise ValueError("a pool needs at least one loop")
+
+        self._workers = [_LoopWorker(i) for i in range(size)]
+        self._by_loop = dict((w.loop, w) for w in self._workers)
+        self._next = itertools.cycle(self._workers)
+        self._started = False
+
+        self.loops = [w.loop for w in self._workers]
+
+    def __len__(self):
+        return len(self._workers)
+
+    @property
+    def started(self):
+        """*Read only*
+
+            Indicates if the loops are running."""
+        return self._started
+
+    def start(self):
+        """ Start running the loops in their threads. """
+        if self._started:
+            return
+
+        self._started = True
+        for w in self._workers:
+            w.start()
+
+    def stop(self):
+        """ Close all the handles of the pool and stop its loops. """
+        if not self._started:
+            return
+
+        for w in self._workers:
+            w.stop()
+        self._started = False
+
+    def loop_for(self, key=None):
+        """ Return the loop where a handle is placed for this key, the
+        next loop in round-robin order if key is None. """
+        return self._worker_for(key).loop
+
+    def add(self, socket, key=None):
+        """\
+            :param socket: zmq socket
+            :param key: hashable object. Sockets added with the same key
+                are placed on the same loop. By default the loops are
+                used in round-robin order.
+
+            Create a :doc:`zmq` for the socket on one of the loops and
+            return it. The socket must not be used by this thread
+            anymore.
+        """
+        worker = self._worker_for(key)
+        return worker.call_wait(ZMQ, worker.loop, socket)
+
+    def call(self, handle, fn, *args, **kwargs):
+        """ Call ``fn(*args, **kwargs)`` in the thread of the loop of
+        the handle. Can be called from any thread. """
+        self._worker(handle).call(fn, *args, **kwargs)
+
+    def write(self, handle, msg, flags=0, copy=True, track=False,
+            callback=None):
+        """ Send a multipart message on the handle from any thread. See
+        :py:meth:`uzmq.sock.ZMQ.write_multipart`. """
+        self._worker(handle)
+        handle.write_multipart_threadsafe(msg, flags=flags, copy=copy,
+                track=track, callback=callback)
+
+    def _worker(self, handle):
+        try:
+            return self._by_loop[handle.loop]
+        except KeyError:
+            raise ValueError("the handle doesn't belong to this pool")
+
+    def _worker_for(self, key):
+        if key is None:
+            return next(self._next)
+        return self._workers[hash(key) % len(self._workers)]
+
+
+def _cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
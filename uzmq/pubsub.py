@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+Publisher and Subscriber: topic based publishing and dispatching
+
+The first frame of a message is its topic. The snapshot socket of a
+:py:class:`Publisher` answers requests ``[prefix]`` sent by DEALER
+sockets with a ``[SNAPSHOT, msg...]`` message for each cached topic
+starting with the prefix, followed by ``[SNAPSHOT_END]``.
+"""
+from collections import OrderedDict
+
+import zmq
+
+from .sock import ZMQ, QUEUE_BLOCK
+from . import util
+
+SNAPSHOT = b'\x01'
+SNAPSHOT_END = b'\x02'
+
+# number of messages received each time the socket is readable
+BATCH = 256
+
+# number of messages waiting to be sent before updates are conflated
+MAX_QUEUE = 64
+
+
+class _Node(object):
+
+    __slots__ = ('children', 'handlers')
+
+    def __init__(self):
+        self.children = {}
+        self.handlers = []
+
+
+class Subscriber(object):
+    """\
+        :param loop: loop object where this subscriber runs.
+        :param socket: zmq SUB socket
+
+        A ``Subscriber`` routes the messages of a SUB socket to the
+        handlers subscribed to a prefix of their first frame. Handlers
+        are indexed in a prefix tree, so the cost of dispatching a
+        message depends on the length of its topic only.
+
+        The socket is subscribed to a prefix as long as a handler is
+        subscribed to it.
+
+        Handler signature: ``handler(subscriber, msg)``.
+
+        .. py:attribute:: handle
+
+            *Read only*
+
+            :doc:`zmq` of the socket.
+    """
+
+    def __init__(self, loop, socket):
+        self.loop = loop
+        self.handle = ZMQ(loop, socket)
+
+        self._root = _Node()
+        self._refs = {}
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if the subscriber is closed."""
+        return self.handle.closed
+
+    @property
+    def topics(self):
+        """*Read only*
+
+            List of the prefixes the socket is subscribed to."""
+        return sorted(self._refs)
+
+    def subscribe(self, prefix, handler):
+        """ Call the handler with the messages starting with prefix. """
+        if not util.is_callable(handler):
+            raise TypeError("a callable is required")
+
+        prefix = util.to_bytes(prefix)
+        node = self._root
+        for c in bytearray(prefix):
+            child = node.children.get(c)
+            if child is None:
+                child = node.children[c] = _Node()
+            node = child
+        node.handlers.append(handler)
+
+        count = self._refs.get(prefix, 0)
+        if not count:
+            self.handle.setsockopt(zmq.SUBSCRIBE, prefix)
+        self._refs[prefix] = count + 1
+
+    def unsubscribe(self, prefix, handler):
+        """ Remove a handler subscribed to prefix. """
+        prefix = util.to_bytes(prefix)
+        chars = bytearray(prefix)
+
+        path = [self._root]
+        for c in chars:
+            node = path[-1].children.get(c)
+            if node is None:
+                break
+            path.append(node)
+
+        if len(path) <= len(chars) or handler not in path[-1].handlers:
+            raise ValueError("handler not subscribed")
+        path[-1].handlers.remove(handler)
+
+        # prune the nodes left without handler nor children
+        for i in range(len(chars), 0, -1):
+            node = path[i]
+            if node.handlers or node.children:
+                break
+            del path[i - 1].children[chars[i - 1]]
+
+        count = self._refs[prefix] - 1
+        if count:
+            self._refs[prefix] = count
+        else:
+            del self._refs[prefix]
+            self.handle.setsockopt(zmq.UNSUBSCRIBE, prefix)
+
+    def start(self):
+        """ Start dispatching the messages. """
+        self.handle.start_read(batch_callback=self._on_read, batch=BATCH)
+
+    def stop(self):
+        """ Stop dispatching the messages. """
+        self.handle.stop_read()
+
+    def close(self):
+        """ Close the handle of the subscriber. The socket is not
+        closed. """
+        self.handle.close()
+
+    def handlers(self, topic):
+        """ Return the handlers of a topic, the handlers of its shortest
+        prefixes first. """
+        node = self._root
+        handlers = list(node.handlers)
+        for c in bytearray(topic):
+            node = node.children.get(c)
+            if node is None:
+                break
+            handlers.extend(node.handlers)
+        return handlers
+
+    def _on_read(self, handle, msgs, err):
+        if msgs is None:
+            # receive error, already logged by the handle
+            return
+
+        for msg in msgs:
+            for handler in self.handlers(msg[0]):
+                handler(self, msg)
+
+
+class Publisher(object):
+    """\
+        :param loop: loop object where this publisher runs.
+        :param socket: zmq XPUB socket, or PUB socket without
+            conflation.
+        :param conflate: bool
+            Conflate the updates waiting to be sent. Requires a XPUB
+            socket.
+        :param max_queue: int
+            Number of messages waiting to be sent on the socket before
+            updates are conflated.
+        :param cache: bool
+            Keep the last message published on each topic.
+        :param snapshot: zmq ROUTER socket answering the snapshot
+            requests from the cache. Implies ``cache``.
+
+        A ``Publisher`` sends messages on a XPUB socket. When
+        ``max_queue`` messages are already waiting to be sent, the
+        updates are held back and an update replaces the one held for
+        the same topic, keeping its place, so only the last value of
+        each topic is sent once the socket catches up.
+
+        A PUB socket silently drops the newest messages once a
+        subscriber reaches its high water mark, so the updates never
+        wait to be sent. With conflation ``zmq.XPUB_NODROP`` is set on
+        the socket instead: sends fail with ``EAGAIN`` and the updates
+        are held back until the slowest subscriber catches up. The
+        subscription messages received by the socket are discarded.
+
+        .. py:attribute:: handle
+
+            *Read only*
+
+            :doc:`zmq` of the socket.
+
+        .. py:attribute:: snapshot
+
+            *Read only*
+
+            :doc:`zmq` of the snapshot socket or None.
+    """
+
+    def __init__(self, loop, socket, conflate=True, max_queue=MAX_QUEUE,
+            cache=False, snapshot=None):
+        xpub = socket.getsockopt(zmq.TYPE) == zmq.XPUB
+        if conflate and not xpub:
+            raise ValueError("conflation requires a XPUB socket")
+
+        self.loop = loop
+        self.conflate = conflate
+        self.max_queue = max_queue
+
+        self.handle = ZMQ(loop, socket)
+        self.handle.set_queue_limit(max_messages=max_queue,
+                policy=QUEUE_BLOCK, on_drain=self._on_drain)
+        if conflate:
+            # block at the high water mark instead of dropping
+            self.handle.setsockopt(zmq.XPUB_NODROP, 1)
+        if xpub:
+            self.handle.start_read(batch_callback=self._on_subscriptions,
+                    batch=BATCH)
+
+        self._pending = OrderedDict()
+        self._cache = None
+        if cache or snapshot is not None:
+            self._cache = {}
+
+        if snapshot is not None:
+            self.snapshot = ZMQ(loop, snapshot)
+            self.snapshot.start_read(batch_callback=self._on_snapshot,
+                    batch=BATCH)
+        else:
+            self.snapshot = None
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if the publisher is closed."""
+        return self.handle.closed
+
+    @property
+    def pending(self):
+        """*Read only*
+
+            Number of conflated updates waiting to be sent."""
+        return len(self._pending)
+
+    def publish(self, msg):
+        """ Publish a multipart message, its first frame being the
+        topic, bytes or str. """
+        msg = [util.to_frame(m) for m in msg]
+        topic = msg[0]
+
+        if self._cache is not None:
+            self._cache[topic] = msg
+
+        if self.conflate and (self._pending or
+                self.handle.queued_messages >= self.max_queue):
+            # a held back update keeps its place
+            self._pending[topic] = msg
+        else:
+            self.handle.write_multipart(msg)
+
+    def last_value(self, topic):
+        """ Return the last message published on the topic, None if
+        there is none or the cache is disabled. """
+        if self._cache is None:
+            return None
+        return self._cache.get(util.to_bytes(topic))
+
+    def close(self):
+        """ Close the handles of the publisher. The sockets are not
+        closed. """
+        self._pending.clear()
+        for handle in (self.handle, self.snapshot):
+            if handle is not None and not handle.closed:
+                handle.close()
+
+    def _on_drain(self, handle):
+        pending = self._pending
+        while pending and handle.queued_messages < self.max_queue:
+            topic, msg = pending.popitem(last=False)
+            handle.write_multipart(msg)
+
+    def _on_subscriptions(self, handle, msgs, err):
+        pass
+
+    def _on_snapshot(self, handle, msgs, err):
+        if msgs is None:
+            # receive error, already logged by the handle
+            return
+
+        for msg in msgs:
+            envelope, prefix = msg[:-1], msg[-1]
+            for topic, value in self._cache.items():
+                if topic.startswith(prefix):
+                    handle.write_multipart(envelope + [SNAPSHOT] + value)
+            handle.write_multipart(envelope + [SNAPSHOT_END])
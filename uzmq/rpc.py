@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+Client: pipelined requests over a DEALER socket
+
+Each request is sent as ``[request_id, b'', payload...]``. The request
+id is a routing frame for REP sockets and for the
+:py:class:`uzmq.patterns.Broker`, so both send it back with the reply
+and replies can arrive in any order.
+"""
+import itertools
+import struct
+
+from .errors import RequestCancelled, RequestTimeout
+from .sock import ZMQ
+from .timers import get_timer_wheel
+from . import util
+
+try:
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
+
+# number of replies received each time the socket is readable
+BATCH = 256
+
+
+class _Request(object):
+
+    __slots__ = ('callback', 'future', 'timeout')
+
+    def __init__(self, callback, future):
+        self.callback = callback
+        self.future = future
+        self.timeout = None
+
+
+class Client(object):
+    """\
+        :param loop: loop object where this client runs.
+        :param socket: zmq DEALER socket connected to the servers.
+        :param timeout: float
+            Default timeout of the requests in seconds, None for no
+            timeout.
+        :param wheel: :py:class:`uzmq.timers.TimerWheel` used for the
+            timeouts. By default the wheel shared by the handles of the
+            loop is used.
+
+        A ``Client`` sends requests without waiting for the replies of
+        the previous ones. The replies are matched to their request by
+        id and passed to the callback of the request, or set as the
+        result of its future.
+
+        Callback signature: ``callback(client, reply, error)``.
+
+        A request that times out gets a :py:class:`RequestTimeout`
+        error, and its reply is ignored if it arrives later. The
+        requests still waiting when the client is closed get a
+        :py:class:`RequestCancelled` error.
+
+        .. py:attribute:: handle
+
+            *Read only*
+
+            :doc:`zmq` of the socket.
+    """
+
+    def __init__(self, loop, socket, timeout=None, wheel=None):
+        self.loop = loop
+        self.timeout = timeout
+        self.wheel = wheel or get_timer_wheel(loop)
+        self.handle = ZMQ(loop, socket)
+        self.handle.start_read(batch_callback=self._on_read, batch=BATCH)
+
+        self._ids = itertools.count()
+        self._requests = {}
+
+    def __len__(self):
+        return len(self._requests)
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if the client is closed."""
+        return self.handle.closed
+
+    def request(self, msg, callback=None, timeout=None):
+        """\
+            :param msg: list of str, bytes, buffers or Frame, the payload
+                of the request.
+            :param callback: callable
+                Function called with the reply.
+            :param timeout: float
+                Timeout of the request in seconds, the default timeout
+                of the client if None.
+
+            Send a request. Without callback a
+            ``concurrent.futures.Future`` of the reply is returned.
+        """
+        future = None
+        if callback is None:
+            if Future is None:
+                raise TypeError("a callable is required")
+            future = Future()
+        elif not util.is_callable(callback):
+            raise TypeError("a callable is required")
+
+        if timeout is None:
+            timeout = self.timeout
+
+        req_id = struct.pack('>I', next(self._ids) & 0xffffffff)
+        req = self._requests[req_id] = _Request(callback, future)
+        if timeout is not None:
+            req.timeout = self.wheel.schedule(timeout, self._on_timeout,
+                    req_id)
+
+        self.handle.write_multipart([req_id, b''] + list(msg))
+        return future
+
+    def close(self):
+        """ Close the client. Its socket is not closed. """
+        self.handle.close()
+
+        requests, self._requests = self._requests, {}
+        for req in requests.values():
+            if req.timeout is not None:
+                req.timeout.cancel()
+            self._complete(req, None, RequestCancelled())
+
+    def _on_read(self, handle, msgs, err):
+        if msgs is None:
+            # receive error, already logged by the handle
+            return
+
+        for msg in msgs:
+            if len(msg) < 2 or msg[1]:
+                continue
+
+            req = self._requests.pop(msg[0], None)
+            if req is not None:
+                if req.timeout is not None:
+                    req.timeout.cancel()
+                self._complete(req, msg[2:], None)
+
+    def _complete(self, req, reply, error):
+        if req.future is not None:
+            if isinstance(error, RequestCancelled):
+                req.future.cancel()
+            elif error is not None:
+                req.future.set_exception(error)
+            else:
+                req.future.set_result(reply)
+        else:
+            req.callback(self, reply, error)
+
+    def _on_timeout(self, req_id):
+        req = self._requests.pop(req_id, None)
+        if req is not None:
+            self._complete(req, None, RequestTimeout())
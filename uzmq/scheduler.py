@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+Scheduler: handles re-checked on the next loop iteration
+
+"""
+from collections import OrderedDict
+import logging
+
+import pyuv
+
+from . import util
+
+# callbacks run per loop iteration
+MAX_CALLS = 1024
+
+
+class Scheduler(object):
+    """\
+        :param loop: loop object where this scheduler runs.
+        :param max_calls: int
+            Maximum number of callbacks run per loop iteration, the
+            others wait for the next iteration so the loop polls for
+            I/O in between. None for no limit.
+
+        A ``Scheduler`` runs the callbacks scheduled during a loop
+        iteration in one pass, right before the loop polls for I/O,
+        with a single ``pyuv.Prepare`` handle. The loop doesn't block
+        while callbacks are pending.
+
+        The :doc:`zmq` use it to check ``zmq.EVENTS`` again when the
+        socket won't signal its file descriptor, like after a read
+        batch was cut short.
+
+        Callback signature: ``callback()``.
+    """
+
+    def __init__(self, loop, max_calls=MAX_CALLS):
+        self.loop = loop
+        self.max_calls = max_calls
+
+        # key -> (sequence number, callback)
+        self._ready = OrderedDict()
+        self._seq = 0
+        self._prepare_h = pyuv.Prepare(loop)
+        self._idle_h = pyuv.Idle(loop)
+
+    def __len__(self):
+        return len(self._ready)
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if the scheduler is closed."""
+        return self._prepare_h.closed
+
+    def schedule(self, key, callback):
+        """ Run the callback on the next loop iteration. Only the first
+        callback scheduled with a key is run, until it is. """
+        if not util.is_callable(callback):
+            raise TypeError("a callable is required")
+
+        if key in self._ready:
+            return
+        self._ready[key] = (self._seq, callback)
+        self._seq += 1
+
+        if not self._prepare_h.active:
+            self._prepare_h.start(self._on_prepare)
+            # don't block in the poll phase
+            self._idle_h.start(self._on_idle)
+
+    def cancel(self, key):
+        """ Forget the callback scheduled with a key, if any. """
+        self._ready.pop(key, None)
+
+    def close(self):
+        """ Close the scheduler. Pending callbacks are dropped. """
+        self._prepare_h.close()
+        self._idle_h.close()
+        self._ready.clear()
+
+    def _on_idle(self, handle):
+        pass
+
+    def _on_prepare(self, handle):
+        ready = self._ready
+        max_calls = self.max_calls
+
+        # the callbacks scheduled during this pass run on the next one
+        end = self._seq
+        calls = 0
+        while ready and (max_calls is None or calls < max_calls):
+            key = next(iter(ready))
+            seq, callback = ready[key]
+            if seq >= end:
+                break
+
+            del ready[key]
+            calls += 1
+            try:
+                callback()
+            except Exception:
+                logging.exception("SCHEDULER callback error")
+
+        if not ready and not self._prepare_h.closed:
+            self._prepare_h.stop()
+            self._idle_h.stop()
+
+
+def get_scheduler(loop):
+    """ return the :py:class:`Scheduler` shared by the handles of this
+    loop. """
+    return util.loop_local(loop, 'scheduler', Scheduler)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+Serializers: objects to multipart messages
+
+A serializer, or codec, is any object with a ``dumps(obj)`` method
+returning the list of frames of the message and a ``loads(frames)``
+method returning the object. The frames passed to ``loads`` are bytes,
+or ``zmq.Frame`` objects when the message was received without copy.
+
+Codecs are registered by name with :py:func:`register`. The ``pickle``
+and ``json`` codecs are always available, ``msgpack`` when the msgpack
+package is installed.
+
+.. warning::
+
+    Unpickling data can run arbitrary code. Only use the ``pickle``
+    codec to decode messages from trusted peers.
+"""
+import json
+import pickle
+
+import zmq
+
+from . import util
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_codecs = {}
+
+
+class PickleCodec(object):
+    """\
+        :param protocol: int, pickle protocol, the highest one by
+            default.
+        :param oob_threshold: int
+            With the protocol 5, the buffers of this size or bigger
+            exported out of band, like the data of numpy arrays or
+            ``pickle.PickleBuffer`` objects, are sent as separate frames
+            instead of being copied in the pickle.
+
+        Buffers received without copy are unpickled without copy
+        either, the objects using them are only valid as long as the
+        frames are alive.
+
+        .. warning::
+
+            Unpickling a message can run arbitrary code. Only decode
+            messages from trusted peers with this codec.
+    """
+
+    def __init__(self, protocol=None, oob_threshold=1024):
+        if protocol is None:
+            protocol = pickle.HIGHEST_PROTOCOL
+        self.protocol = protocol
+        self.oob_threshold = oob_threshold
+
+    def dumps(self, obj):
+        if self.protocol < 5:
+            return [pickle.dumps(obj, self.protocol)]
+
+        buffers = []
+        def buffer_callback(buf):
+            try:
+                view = buf.raw()
+            except BufferError:
+                # not contiguous
+                return True
+            if view.nbytes < self.oob_threshold:
+                # pickled in band
+                return True
+            buffers.append(view)
+            return False
+
+        data = pickle.dumps(obj, self.protocol,
+                buffer_callback=buffer_callback)
+        return [data] + buffers
+
+    def loads(self, frames):
+        if len(frames) == 1:
+            return pickle.loads(util.frame_buffer(frames[0]))
+        return pickle.loads(util.frame_buffer(frames[0]),
+                buffers=[util.frame_buffer(f) for f in frames[1:]])
+
+
+class JSONCodec(object):
+    """ JSON documents encoded in utf-8 in one frame. """
+
+    def dumps(self, obj):
+        return [json.dumps(obj, separators=(',', ':')).encode('utf8')]
+
+    def loads(self, frames):
+        frame = frames[0]
+        if isinstance(frame, zmq.Frame):
+            frame = frame.bytes
+        elif not isinstance(frame, util.binary_type):
+            frame = bytes(frame)
+        return json.loads(frame.decode('utf8'))
+
+
+class MsgpackCodec(object):
+    """ msgpack documents in one frame. Requires the msgpack package.
+    """
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("msgpack isn't installed")
+
+    def dumps(self, obj):
+        return [msgpack.packb(obj, use_bin_type=True)]
+
+    def loads(self, frames):
+        return msgpack.unpackb(util.frame_buffer(frames[0]), raw=False)
+
+
+def register(name, codec):
+    """ Register a codec under a name. """
+    if not (util.is_callable(getattr(codec, 'dumps', None)) and
+            util.is_callable(getattr(codec, 'loads', None))):
+        raise TypeError("a codec needs dumps and loads methods")
+    _codecs[name] = codec
+
+
+def get_serializer(serializer):
+    """ Return the codec registered under this name. Codec objects and
+    None are returned untouched. """
+    if serializer is None or not isinstance(serializer, util.string_types):
+        return serializer
+
+    try:
+        return _codecs[serializer]
+    except KeyError:
+        raise ValueError("unknown serializer: %r" % serializer)
+
+
+register('pickle', PickleCodec())
+register('json', JSONCodec())
+if msgpack is not None:
+    register('msgpack', MsgpackCodec())
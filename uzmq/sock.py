@@ -8,51 +8,446 @@ import logging
 import pyuv
 import zmq
 
+from .compression import Compressor, THRESHOLD
+from .errors import MessageExpired, QueueFull
+from .serializers import get_serializer
 from .poll import ZMQPoll
+from .scheduler import get_scheduler
+from .stats import HandleStats
+from .timers import get_timer_wheel
 from . import util
 
+# send queue policies
+QUEUE_RAISE = "raise"
+QUEUE_DROP_OLDEST = "drop-oldest"
+QUEUE_DROP_NEWEST = "drop-newest"
+QUEUE_BLOCK = "block"
+
+QUEUE_POLICIES = (QUEUE_RAISE, QUEUE_DROP_OLDEST, QUEUE_DROP_NEWEST,
+        QUEUE_BLOCK)
+
+# frames bigger than this size are sent without being copied
+COPY_THRESHOLD = getattr(zmq, 'COPY_THRESHOLD', 65536)
+
+# interval in seconds between two checks of the tracked messages. It
+# is doubled, up to TRACK_MAX_INTERVAL, each time none was released.
+TRACK_INTERVAL = 0.001
+TRACK_MAX_INTERVAL = 0.1
+
+# tracked messages not released after this delay in seconds are
+# forgotten, their on_released callback is never called.
+TRACK_TIMEOUT = 60.0
+
+# XPUB sockets always report POLLOUT, a send blocked at the high water
+# mark is retried after this delay in seconds, doubled up to
+# SEND_RETRY_MAX_INTERVAL while the socket stays blocked.
+SEND_RETRY_INTERVAL = 0.01
+SEND_RETRY_MAX_INTERVAL = 0.1
+
+# frames that can be sent without copy safely, they can't be modified
+# while zmq still uses them.
+_IMMUTABLE_FRAMES = (util.binary_type, zmq.Frame)
+
+# recv_into is available since pyzmq 26.4
+HAS_RECV_INTO = hasattr(zmq.Socket, 'recv_into')
+
+
+class _Message(object):
+    """ a message waiting in the send queue """
+
+    __slots__ = ('msg', 'frames', 'kwargs', 'callback', 'size',
+            'tracker', 'on_released', 'expires')
+
+    def __init__(self, msg, kwargs, callback, size, frames=None,
+            tracker=None, on_released=None, expires=None):
+        self.msg = msg
+        self.frames = frames
+        self.kwargs = kwargs
+        self.callback = callback
+        self.size = size
+        self.tracker = tracker
+        self.on_released = on_released
+        self.expires = expires
+
+
+
+class _Tracker(object):
+    """ check the trackers of the messages sent by the handles of a loop
+    until zmq releases them, with a single timer backing off while
+    nothing is released """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._tracked = []
+        self._interval = TRACK_INTERVAL
+        self._timer_h = pyuv.Timer(loop)
+
+    @property
+    def closed(self):
+        return self._timer_h.closed
+
+    def add(self, handle, m):
+        self._tracked.append((handle, m, util.monotonic() + TRACK_TIMEOUT))
+
+        if not self._timer_h.active or self._interval > TRACK_INTERVAL:
+            self._interval = TRACK_INTERVAL
+            self._timer_h.start(self._on_timer, TRACK_INTERVAL, 0)
+
+    def cancel(self, handle):
+        self._tracked = [t for t in self._tracked if t[0] is not handle]
+        if not self._tracked:
+            self._timer_h.stop()
+
+    def _on_timer(self, timer):
+        now = util.monotonic()
+        released = False
+        tracked, self._tracked = self._tracked, []
+        for entry in tracked:
+            handle, m, deadline = entry
+            if m.tracker.done:
+                released = True
+                try:
+                    m.on_released(handle, m.msg)
+                except Exception:
+                    logging.exception("RELEASED callback error")
+            elif deadline <= now:
+                logging.error("TRACK Error: message not released after "
+                        "%ss", TRACK_TIMEOUT)
+            else:
+                self._tracked.append(entry)
+
+        if not self._tracked:
+            return
+
+        if released:
+            self._interval = TRACK_INTERVAL
+        else:
+            self._interval = min(self._interval * 2, TRACK_MAX_INTERVAL)
+        timer.start(self._on_timer, self._interval, 0)
+
+
+class _ReadExecutor(object):
+    """ run the read callback of a handle in an executor and bring the
+    replies back to the loop """
+
+    def __init__(self, handle, executor, max_inflight, ordered):
+        self.handle = handle
+        self.executor = executor
+        self.max_inflight = max_inflight
+        self.ordered = ordered
+
+        self.inflight = 0
+        self.closed = False
+        self._submit_seq = 0
+        self._deliver_seq = 0
+        self._results = {}
+        self._calls = handle._calls
+
+    @property
+    def full(self):
+        return (self.max_inflight is not None and
+                self.inflight >= self.max_inflight)
+
+    def submit(self, callback, msg):
+        seq = self._submit_seq
+        self._submit_seq += 1
+
+        self.inflight += 1
+        if self.inflight == 1 and not self.closed:
+            # keep the loop running until the work is done
+            self._calls.hold()
+
+        fut = self.executor.submit(callback, msg)
+        # the results are passed to the loop with the call queue
+        fut.add_done_callback(
+                lambda f: self._calls.call(self._on_done, seq, f))
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        if self.inflight:
+            self._calls.release()
+
+    def _on_done(self, seq, fut):
+        if self.ordered:
+            results = self._results
+            results[seq] = fut
+            while self._deliver_seq in results:
+                self._deliver(results.pop(self._deliver_seq))
+                self._deliver_seq += 1
+        else:
+            self._deliver(fut)
+
+        if not self.inflight and not self.closed:
+            self._calls.release()
+
+        # reading may have been paused
+        self.handle._prepare()
+
+    def _deliver(self, fut):
+        self.inflight -= 1
+        if self.handle.closed:
+            return
+
+        try:
+            reply = fut.result()
+        except Exception:
+            logging.exception("READ callback error")
+            return
+
+        if reply is not None:
+            if self.handle._read_decode:
+                self.handle.write_obj(reply)
+                return
+
+            if not isinstance(reply, (list, tuple)):
+                reply = [reply]
+            self.handle.write_multipart(reply)
+
+
+def _socket_method(name):
+    """ return a method calling the method ``name`` of the socket """
+    def method(self, *args, **kwargs):
+        return getattr(self.socket, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = "Call ``socket.%s``." % name
+    return method
+
+
 class ZMQ(object):
     """\
         :param loop: loop object where this handle runs (accessible
             through :py:attr:`Poll.loop`).
         :param int socket: zmq socket
+        :param serializer: name of a registered codec or codec object
+            used by :py:meth:`write_obj` and to decode the messages read
+            with ``decode=True``. See :doc:`serializers`. The
+            ``pickle`` codec must only be used with trusted peers:
+            decoding a message with it can run arbitrary code.
 
         The ZMQ handles provides asynchronous ZMQ sockets functionnality
         both for bound and connected sockets.
+
+        .. py:attribute:: copy_threshold
+
+            Messages with a frame bigger than this size in bytes are
+            sent with ``copy=False``, so large buffers are handed to zmq
+            without being copied. Set it to None to disable it. Only
+            messages made of immutable frames, bytes or ``zmq.Frame``,
+            are concerned: zmq may still use a buffer after the write
+            callback, so mutable buffers like ``bytearray`` are copied
+            unless ``on_released`` is given.
+
+        .. py:attribute:: send_ttl
+
+            Default time to live in seconds of the written messages,
+            None for no limit. See :py:meth:`write_multipart`.
+
+        .. py:attribute:: serializer
+
+            Codec of the handle or None.
     """
 
+    __slots__ = ('loop', 'socket', 'serializer', 'copy_threshold',
+            'send_ttl', 'fd', '_poll', '_scheduler', '_events',
+            '_send_queue', '_tracker', '_queued_bytes',
+            '_max_messages', '_max_bytes', '_queue_policy',
+            '_high_water_cb', '_drain_cb', '_high_water', '_expiry',
+            '_next_expiry', '_read_cb', '_read_batch_cb', '_read_copy',
+            '_read_track', '_read_batch', '_read_max_time',
+            '_read_executor', '_read_decode', '_read_pool', '_compression',
+            '_compressing', '_stats', '_stats_hook', '_stats_h', '_calls',
+            '_xpub', '_send_retry', '_retry_delay')
 
-    def __init__(self, loop, socket):
+    def __init__(self, loop, socket, serializer=None):
         self.loop = loop
         self.socket = socket
+        self.serializer = get_serializer(serializer)
 
-        # shortcircuit some socket methods
-        self.bind = self.socket.bind
-        self.bind_to_random_port = self.socket.bind_to_random_port
-        self.connect = self.socket.connect
-        self.setsockopt = self.socket.setsockopt
-        self.getsockopt = self.socket.getsockopt
-        self.setsockopt_string = self.socket.setsockopt_string
-        self.getsockopt_string = self.socket.getsockopt_string
-        self.setsockopt_unicode = self.socket.setsockopt_unicode
-        self.getsockopt_unicode = self.socket.getsockopt_unicode
+        self.copy_threshold = COPY_THRESHOLD
+        self.send_ttl = None
 
         self.fd = socket.getsockopt(zmq.FD)
         self._poll = pyuv.Poll(loop, self.fd)
         self._poll.start(pyuv.UV_READABLE, self._on_events)
 
-        self._prepare_h = pyuv.Prepare(loop)
-        self._waker = pyuv.Idle(self.loop)
+        self._xpub = socket.getsockopt(zmq.TYPE) == zmq.XPUB
+        self._send_retry = None
+        self._retry_delay = SEND_RETRY_INTERVAL
+
+        # handles checked again on the next loop iteration are run
+        # by the scheduler of the loop.
+        self._scheduler = get_scheduler(loop)
+
+        # the helper handles are created the first time they are needed
+        self._tracker = None
+        self._stats_h = None
 
         self._events = 0
 
         self._send_queue = deque()
+        self._queued_bytes = 0
+        self._max_messages = None
+        self._max_bytes = None
+        self._queue_policy = QUEUE_RAISE
+        self._high_water_cb = None
+        self._drain_cb = None
+        self._high_water = False
+        self._expiry = None
+        self._next_expiry = None
         self._read_cb = None
+        self._read_batch_cb = None
         self._read_copy = True
         self._read_track = False
+        self._read_batch = 1
+        self._read_max_time = None
+        self._read_executor = None
+        self._read_decode = False
+        self._read_pool = None
+        self._compression = None
+        self._compressing = None
+        self._stats = None
+        self._stats_hook = None
+        self._calls = util.call_queue(loop)
+
+    # socket methods
+    bind = _socket_method('bind')
+    bind_to_random_port = _socket_method('bind_to_random_port')
+    connect = _socket_method('connect')
+    setsockopt = _socket_method('setsockopt')
+    getsockopt = _socket_method('getsockopt')
+    setsockopt_string = _socket_method('setsockopt_string')
+    getsockopt_string = _socket_method('getsockopt_string')
+    setsockopt_unicode = _socket_method('setsockopt_unicode')
+    getsockopt_unicode = _socket_method('getsockopt_unicode')
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if this handle is closing or already closed."""
+        return self._poll.closed
+
+    @property
+    def queued_messages(self):
+        """*Read only*
+
+            Number of messages waiting in the send queue."""
+        return len(self._send_queue)
+
+    @property
+    def queued_bytes(self):
+        """*Read only*
+
+            Size in bytes of the messages waiting in the send queue."""
+        return self._queued_bytes
+
+    def set_queue_limit(self, max_messages=None, max_bytes=None,
+            policy=QUEUE_RAISE, on_high_water=None, on_drain=None):
+        """
+        :param max_messages: int
+            Maximum number of messages in the send queue, None for no
+            limit.
+        :param max_bytes: int
+            Maximum size in bytes of the messages in the send queue,
+            None for no limit.
+        :param policy: str
+            What to do with a message written while the queue is full:
+
+            - ``QUEUE_RAISE``: raise :py:class:`uzmq.errors.QueueFull`
+            - ``QUEUE_DROP_OLDEST``: drop the oldest queued messages to
+              make room for it
+            - ``QUEUE_DROP_NEWEST``: drop the written message
+            - ``QUEUE_BLOCK``: queue it anyway and rely on the
+              ``on_high_water`` callback to pause the producer
+
+            Dropped messages are passed to their write callback with a
+            ``QueueFull`` status.
+        :param on_high_water: callable
+            Function called when the queue becomes full.
+        :param on_drain: callable
+            Function called when the queue has been emptied after
+            becoming full.
+
+        Callbacks signature: ``callback(zmq_handle)``.
+
+        Bound the send queue of the handle.
+        """
+        if policy not in QUEUE_POLICIES:
+            raise ValueError("unknown queue policy: %r" % policy)
+
+        for cb in (on_high_water, on_drain):
+            if cb is not None and not util.is_callable(cb):
+                raise TypeError("a callable is required")
+
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._queue_policy = policy
+        self._high_water_cb = on_high_water
+        self._drain_cb = on_drain
+
+    def enable_stats(self, hook=None, interval=1.0):
+        """
+        :param hook: callable
+            Function called every ``interval`` seconds with the current
+            counters, to export them.
+        :param interval: float
+            Interval in seconds between two calls of the hook.
+
+        Hook signature: ``hook(zmq_handle, stats)``.
+
+        Start collecting counters on this handle (messages and bytes
+        received and sent, errors, EAGAIN count, highest send queue
+        depth, number of user callbacks invoked and time spent in them).
+        Counters are not collected by default so they cost nothing when
+        they are not used.
+        """
+        if hook is not None and not util.is_callable(hook):
+            raise TypeError("a callable is required")
+
+        if self._stats is None:
+            self._stats = HandleStats()
+
+        self._stats_hook = hook
+        if hook is not None:
+            if self._stats_h is None:
+                self._stats_h = pyuv.Timer(self.loop)
+            self._stats_h.start(self._on_stats, interval, interval)
+            # the hook alone doesn't keep the loop running
+            self._stats_h.ref = False
+        elif self._stats_h is not None:
+            self._stats_h.stop()
+
+    def disable_stats(self):
+        """ Stop collecting counters. """
+        self._stats = None
+        self._stats_hook = None
+        if self._stats_h is not None:
+            self._stats_h.stop()
+
+    def stats(self, reset=False):
+        """
+        :param reset: bool
+            Reset the counters once they have been read.
+
+        Return a dict of the counters collected on this handle, or None
+        if :py:meth:`enable_stats` has not been called.
+        """
+        if self._stats is None:
+            return None
 
+        stats = self._stats.as_dict()
+        stats['queued_messages'] = len(self._send_queue)
+        stats['queued_bytes'] = self._queued_bytes
+        if reset:
+            self._stats.reset()
+        return stats
 
-    def start_read(self, callback, copy=True, track=False):
+    def start_read(self, callback=None, copy=True, track=False, batch=1,
+            max_time=None, batch_callback=None, executor=None,
+            max_inflight=None, ordered=True, decode=False, pool=None):
         """
         :param callback: callable
             callback must take exactly one argument, which will be a
@@ -65,17 +460,95 @@ class ZMQ(object):
         :param track: bool
             Should the message be tracked for notification that ZMQ has
             finished with it? (ignored if copy=True)
+        :param batch: int
+            Maximum number of messages received each time the socket
+            is readable. Messages are received until the socket has no
+            more of them or the batch is full.
+        :param max_time: float
+            Maximum time in seconds spent receiving a batch, so other
+            handles of the loop are not delayed too long.
+        :param batch_callback: callable
+            If set, the messages received in a batch are passed to it as
+            a list instead of calling ``callback`` for each of them.
+        :param executor: a ``concurrent.futures`` executor (or any
+            object with a compatible ``submit`` method). If set,
+            ``callback(msg)`` is run in it for each message instead of
+            on the loop, and the message it returns, if any, is written
+            back on the handle from the loop. With a process pool the
+            callback and the messages must be picklable. Receive errors
+            are logged and counted in the stats, the callback doesn't
+            get them.
+        :param max_inflight: int
+            Maximum number of messages handled by the executor at once.
+            Reading is paused when it is reached.
+        :param ordered: bool
+            Write the replies back in the order the messages were
+            received. Otherwise they are written as soon as they are
+            ready.
+        :param decode: bool
+            Pass the objects decoded by the serializer of the handle to
+            the callbacks instead of the messages. Replies returned by
+            the executor callback are encoded with :py:meth:`write_obj`.
+            Use ``copy=False`` to decode the buffers of a pickle without
+            copying them. Don't decode messages from untrusted peers
+            with the ``pickle`` codec.
+        :param pool: :py:class:`uzmq.buffers.BufferPool`. If set, the
+            frames are received in buffers of the pool and passed to
+            the callbacks as ``memoryview`` objects, that should be
+            given back to the pool once they are not needed anymore.
+            ``copy`` and ``track`` are ignored. A message with a frame
+            bigger than the buffers of the pool is dropped and the
+            callback gets an ``EMSGSIZE`` error.
+
+        Callback signature: ``callback(zmq_handle, msg, error)``, or
+        ``callback(msg)`` with an executor.
 
-        Callback signature: ``callback(zmq_handle, msg, error)``.
+        Batch callback signature: ``batch_callback(zmq_handle, msgs,
+        error)``.
 
         Start reading for incoming messages from the remote endpoint.
         """
-        if not util.is_callable(callback):
+        if batch_callback is not None:
+            if not util.is_callable(batch_callback):
+                raise TypeError("a callable is required")
+        elif not util.is_callable(callback):
             raise TypeError("a callable is required")
 
+        if batch < 1:
+            raise ValueError("batch should be at least 1")
+
+        if decode and self.serializer is None:
+            raise ValueError("the handle has no serializer")
+
+        if executor is not None and batch_callback is not None:
+            raise ValueError("an executor can't be used with a batch "
+                    "callback")
+
+        if (self._read_executor is not None and
+                executor is not self._read_executor.executor):
+            if self._read_executor.inflight:
+                raise ValueError("messages are still handled by the "
+                        "previous executor")
+            self._read_executor.close()
+            self._read_executor = None
+
+        if executor is not None:
+            if self._read_executor is None:
+                self._read_executor = _ReadExecutor(self, executor,
+                        max_inflight, ordered)
+            else:
+                self._read_executor.max_inflight = max_inflight
+                self._read_executor.ordered = ordered
+
         self._read_cb = callback
+        self._read_batch_cb = batch_callback
         self._read_copy = copy
         self._read_track = track
+        self._read_batch = batch
+        self._read_max_time = max_time
+        self._read_decode = decode
+        self._read_pool = pool
+        self._events |= pyuv.UV_READABLE
 
         self._prepare()
 
@@ -84,7 +557,7 @@ class ZMQ(object):
         self._events = self._events & (~pyuv.UV_READABLE)
 
     def write(self, msg, flags=0, copy=True, track=False,
-            callback=None):
+            callback=None, on_released=None, ttl=None):
         """\
             :param msg: object, str, Frame The content of the message
 
@@ -99,16 +572,27 @@ class ZMQ(object):
                 Should the message be tracked for notification that ZMQ
                 has finished with it? (ignored if copy=True)
 
+            :param on_released: callable
+                Function called once zmq has released the buffers of
+                the message. See :py:meth:`write_multipart`.
+
+            :param ttl: float
+                Time to live of the message in seconds. See
+                :py:meth:`write_multipart`.
+
 
             Callback signature: ``callback(zmq_handle, msg, status)``.
 
                 Send a message.  See zmq.socket.send for details."""
         return self.write_multipart([msg], flags=flags, copy=copy,
-                track=track, callback=callback)
+                track=track, callback=callback, on_released=on_released,
+                ttl=ttl)
 
     def write_multipart(self, msg, flags=0, copy=True, track=False,
-            callback=None):
-        """ :param msg: object, str, Frame, the content of the message
+            callback=None, on_released=None, ttl=None):
+        """ :param msg: list of str, bytes, buffers or Frame, the content
+            of the message. Only str frames are encoded, others are
+            passed to zmq untouched.
             :param flags: int
                 Any supported flag
             :param copy: bool
@@ -118,30 +602,202 @@ class ZMQ(object):
                 Should the message be tracked for notification that ZMQ
                 has finished with it? (ignored if copy=True)
 
+            :param on_released: callable
+                Function called from the loop once zmq has released the
+                buffers of the message, so they can be reused. The
+                frames are sent without copy and tracked.
+
+            :param ttl: float
+                Time to live of the message in seconds,
+                :py:attr:`send_ttl` if None. A message still queued
+                when it expires is dropped and passed to its callback
+                with a :py:class:`uzmq.errors.MessageExpired` status.
+
             Callback signature: ``callback(zmq_handle, msg, status)``.
 
+            Released callback signature: ``on_released(zmq_handle,
+            msg)``.
+
             Send a multipart message. See zmq.socket.send_multipart for
             details."""
 
-        # make sure we are sending bytes
-        msg = [util.to_bytes(m) for m in msg]
+        # only text needs to be encoded, buffers and frames are sent
+        # untouched.
+        msg = [util.to_frame(m) for m in msg]
+
+        compression = self._compression
+        if compression is not None:
+            if compression.executor is not None:
+                # keep the messages in order while some are compressed
+                if self._compressing or compression.wants(msg):
+                    self._compress(msg, flags, copy, track, callback,
+                            on_released, ttl)
+                    return
+            else:
+                return self._write(msg, compression.compress(msg), flags,
+                        copy, track, callback, on_released, ttl)
+
+        return self._write(msg, msg, flags, copy, track, callback,
+                on_released, ttl)
+
+    def set_compression(self, codec='zlib', threshold=THRESHOLD,
+            level=None, executor=None):
+        """
+        :param codec: str, name of a compression codec (``zlib``,
+            ``lz4``, ``zstd``), None to disable compression.
+        :param threshold: int
+            Frames smaller than this size in bytes are not compressed.
+        :param level: int, compression level, the default level of the
+            codec if None.
+        :param executor: a ``concurrent.futures`` executor where the
+            messages are compressed. The messages are still sent in the
+            order they were written. Errors, including the ones of the
+            send queue like :py:class:`uzmq.errors.QueueFull`, are then
+            passed to the write callback.
 
-        kwargs = dict(flags=flags, copy=copy, track=track)
-        self._send_queue.append((msg, kwargs, callback))
+        Compress the frames of the written messages and decompress the
+        received messages. Both ends must enable it. See
+        :doc:`compression`.
+
+        The first frame of the messages of PUB and XPUB sockets is
+        never compressed, so subscribers can still filter on it.
+        """
+        if codec is None:
+            self._compression = None
+            return
+
+        skip = 0
+        if self.socket.getsockopt(zmq.TYPE) in (zmq.PUB, zmq.XPUB):
+            skip = 1
+        self._compression = Compressor(codec, threshold, level, executor,
+                skip)
+
+    def _write(self, msg, frames, flags, copy, track, callback,
+            on_released, ttl):
+        """ queue the frames of a message """
+        sizes = [util.frame_size(m) for m in frames]
+        size = sum(sizes)
+        if self._queue_full(size):
+            if self._queue_policy == QUEUE_RAISE:
+                raise QueueFull()
+            elif self._queue_policy == QUEUE_DROP_NEWEST:
+                self._on_high_water()
+                if self._stats is not None:
+                    self._stats.dropped += 1
+                if util.is_callable(callback):
+                    callback(self, msg, QueueFull())
+                if util.is_callable(on_released):
+                    on_released(self, msg)
+                return
+            elif self._queue_policy == QUEUE_DROP_OLDEST:
+                self._on_high_water()
+                while self._send_queue and self._queue_full(size):
+                    self._drop()
+
+        if (copy and self.copy_threshold is not None and
+                any(n > self.copy_threshold for n in sizes) and
+                all(isinstance(f, _IMMUTABLE_FRAMES) for f in frames)):
+            copy = False
+
+        if frames is msg:
+            frames = None
+
+        tracker = None
+        if on_released is not None:
+            if not util.is_callable(on_released):
+                raise TypeError("a callable is required")
+
+            # send_multipart only tracks the last frame, so track them
+            # all. The frames are only referenced until they are sent,
+            # zmq can't release a buffer while its frame is alive.
+            frames = [m if isinstance(m, zmq.Frame) else zmq.Frame(m,
+                track=True) for m in (frames or msg)]
+            tracker = zmq.MessageTracker(*[f for f in frames
+                if f.tracker is not None])
+            copy = False
+
+        if ttl is None:
+            ttl = self.send_ttl
+
+        expires = None
+        if ttl is not None:
+            expires = util.monotonic() + ttl
+            self._schedule_expiry(expires)
+
+        kwargs = dict(flags=flags | zmq.NOBLOCK, copy=copy, track=track)
+        self._send_queue.append(_Message(msg, kwargs, callback, size,
+            frames, tracker, on_released, expires))
+        self._queued_bytes += size
+
+        stats = self._stats
+        if (stats is not None and
+                len(self._send_queue) > stats.queue_high_water):
+            stats.queue_high_water = len(self._send_queue)
+
+        if self._queue_full(0):
+            self._on_high_water()
+
+        # try to send it as soon as possible
+        self._events |= pyuv.UV_WRITABLE
+        self._prepare()
+
+    def write_obj(self, obj, flags=0, callback=None, on_released=None,
+            ttl=None):
+        """ Encode an object with the serializer of the handle and send
+        it. The frames of the message are passed to the callback. See
+        :py:meth:`write_multipart` for the other arguments. """
+        if self.serializer is None:
+            raise ValueError("the handle has no serializer")
+
+        return self.write_multipart(self.serializer.dumps(obj), flags=flags,
+                callback=callback, on_released=on_released, ttl=ttl)
+
+    def write_threadsafe(self, msg, flags=0, copy=True, track=False,
+            callback=None, ttl=None):
+        """ Send a message from any thread. See
+        :py:meth:`write_multipart_threadsafe`. """
+        self.write_multipart_threadsafe([msg], flags=flags, copy=copy,
+                track=track, callback=callback, ttl=ttl)
+
+    def write_multipart_threadsafe(self, msg, flags=0, copy=True,
+            track=False, callback=None, ttl=None):
+        """ Queue a multipart message from any thread. The message is
+        passed to :py:meth:`write_multipart` from the loop, the
+        messages queued until the loop wakes up are written at once.
+
+        The callback is called from the loop. Errors raised by
+        :py:meth:`write_multipart`, like :py:class:`QueueFull`, are
+        passed to it as status.
+
+        Callback signature: ``callback(zmq_handle, msg, status)``.
+        """
+        # the calls queued until the loop wakes up are run at once
+        self._calls.call(self._write_threadsafe, msg, flags, copy, track,
+                callback, ttl)
 
     def stop(self):
         """ Stop the ZMQ handle """
         self._poll.stop()
-        self._prepare_h.stop()
-        self._waker.stop()
+        self._scheduler.cancel(self)
+        self._cancel_expiry()
+        self._cancel_send_retry()
+        if self._stats_h is not None:
+            self._stats_h.stop()
 
     def close(self):
         """Close the ZMQ handle. After a handle has been closed no other
         operations can be performed on it."""
 
         self._poll.close()
-        self._prepare_h.close()
-        self._waker.close()
+        self._scheduler.cancel(self)
+        if self._tracker is not None and not self._tracker.closed:
+            self._tracker.cancel(self)
+        self._cancel_expiry()
+        self._cancel_send_retry()
+        if self._stats_h is not None:
+            self._stats_h.close()
+        if self._read_executor is not None:
+            self._read_executor.close()
 
     def flush(self):
         """Flush pending messages.
@@ -149,43 +805,211 @@ class ZMQ(object):
         This method safely handles all pending incoming and/or outgoing
         messages, bypassing the inner loop, passing them to the registered
         callbacks."""
-        if self._send_queue:
-            while True:
-                try:
-                    self._send()
-                except IndexError:
-                    break
+        self._on_write()
 
     def _send(self):
-        res = self._send_queue.popleft()
-        msg, kwargs, cb = res
-        kwargs['flags'] = zmq.NOBLOCK | kwargs['flags']
+        """ send the message at the head of the queue, return False if
+        the socket can't accept it right now """
+        m = self._send_queue[0]
+        stats = self._stats
+        if m.expires is not None and m.expires <= util.monotonic():
+            self._send_queue.popleft()
+            if stats is not None:
+                stats.expired += 1
+            self._discard(m, MessageExpired())
+            return True
+
         try:
-            status = self.socket.send_multipart(msg, **kwargs)
+            status = self.socket.send_multipart(m.frames or m.msg,
+                    **m.kwargs)
         except zmq.ZMQError as e:
+            if e.errno == zmq.EAGAIN:
+                if stats is not None:
+                    stats.send_eagain += 1
+                return False
+
             logging.error("SEND Error: %s", e)
             status = e
+            if stats is not None:
+                stats.send_errors += 1
+        else:
+            if stats is not None:
+                stats.messages_sent += 1
+                stats.bytes_sent += m.size
+
+        self._send_queue.popleft()
+        self._queued_bytes -= m.size
+        m.frames = None
+        if util.is_callable(m.callback):
+            if stats is None:
+                m.callback(self, m.msg, status)
+            else:
+                self._timed_call(m.callback, m.msg, status)
 
-        if util.is_callable(cb):
-            cb(self, msg, status)
+        if m.on_released is not None:
+            if isinstance(status, zmq.ZMQError):
+                m.on_released(self, m.msg)
+            else:
+                self._track(m)
+        return True
 
-    def _prepare_cb(self, handle):
-        handle.stop()
+    def _write_threadsafe(self, msg, flags, copy, track, callback, ttl):
+        if self.closed:
+            return
 
-        z_events = self.socket.getsockopt(zmq.EVENTS)
+        try:
+            self.write_multipart(msg, flags=flags, copy=copy, track=track,
+                    callback=callback, ttl=ttl)
+        except Exception as e:
+            if util.is_callable(callback):
+                callback(self, msg, e)
+            else:
+                logging.error("SEND Error: %s", e)
 
-        if z_events & zmq.POLLIN:
-            self._on_read()
+    def _compress(self, msg, *args):
+        entry = [msg, None, args]
+        if self._compressing is None:
+            self._compressing = deque()
+        self._compressing.append(entry)
 
-        if z_events & zmq.POLLOUT:
-            self._on_write()
+        fut = self._compression.executor.submit(
+                self._compression.compress, msg)
+        def done(fut):
+            # called from the executor thread
+            entry[1] = fut
+            self._calls.call(self._on_compressed)
+        fut.add_done_callback(done)
+
+    def _on_compressed(self):
+        queue = self._compressing
+        while queue and queue[0][1] is not None:
+            msg, fut, args = queue.popleft()
+            if self.closed:
+                continue
+
+            callback = args[3]
+            try:
+                self._write(msg, fut.result(), *args)
+            except Exception as e:
+                if util.is_callable(callback):
+                    callback(self, msg, e)
+                else:
+                    logging.error("SEND Error: %s", e)
+
+    def _timed_call(self, callback, *args):
+        stats = self._stats
+        start = util.monotonic()
+        try:
+            callback(self, *args)
+        finally:
+            stats.callbacks += 1
+            stats.callback_time += util.monotonic() - start
+
+    def _on_stats(self, handle):
+        if self._stats is not None:
+            self._stats_hook(self, self.stats())
+
+    def _queue_full(self, size):
+        if (self._max_messages is not None and
+                len(self._send_queue) >= self._max_messages):
+            return True
+
+        return (self._max_bytes is not None and
+                self._queued_bytes + size > self._max_bytes)
+
+    def _drop(self):
+        m = self._send_queue.popleft()
+        if self._stats is not None:
+            self._stats.dropped += 1
+        self._discard(m, QueueFull())
+
+    def _discard(self, m, error):
+        """ forget a message removed from the queue without sending it
+        """
+        self._queued_bytes -= m.size
+        m.frames = None
+        if util.is_callable(m.callback):
+            m.callback(self, m.msg, error)
+        if m.on_released is not None:
+            m.on_released(self, m.msg)
+
+    def _schedule_expiry(self, expires):
+        if self._expiry is not None:
+            if self._next_expiry <= expires:
+                return
+            self._expiry.cancel()
+
+        self._next_expiry = expires
+        self._expiry = get_timer_wheel(self.loop).schedule(
+                max(expires - util.monotonic(), 0), self._on_expiry)
+
+    def _cancel_expiry(self):
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = self._next_expiry = None
+
+    def _on_expiry(self):
+        """ remove the expired messages from the queue, so they don't
+        wait for the socket to be writable again. """
+        self._expiry = self._next_expiry = None
+
+        now = util.monotonic()
+        expired = []
+        queue = deque()
+        next_expiry = None
+        for m in self._send_queue:
+            if m.expires is None:
+                queue.append(m)
+            elif m.expires <= now:
+                expired.append(m)
+            else:
+                queue.append(m)
+                if next_expiry is None or m.expires < next_expiry:
+                    next_expiry = m.expires
+        self._send_queue = queue
+
+        if next_expiry is not None:
+            self._schedule_expiry(next_expiry)
+
+        stats = self._stats
+        for m in expired:
+            if stats is not None:
+                stats.expired += 1
+            self._discard(m, MessageExpired())
+
+        if not self._send_queue:
+            self._on_drained()
+
+    def _track(self, m):
+        if m.tracker.done:
+            m.on_released(self, m.msg)
+            return
+
+        # the messages of all the handles of the loop are checked by
+        # the same timer.
+        if self._tracker is None or self._tracker.closed:
+            self._tracker = util.loop_local(self.loop, 'tracker', _Tracker)
+        self._tracker.add(self, m)
+
+    def _on_high_water(self):
+        if self._high_water:
+            return
+
+        self._high_water = True
+        if self._high_water_cb is not None:
+            self._high_water_cb(self)
+
+    def _on_scheduled(self):
+        self._on_events(None, 0, None)
 
     def _prepare(self):
-        if self._prepare_h.active:
+        """ check the socket events again on the next loop iteration """
+        if self.closed:
             return
 
-        self._prepare_h.start(self._prepare_cb)
-        self._waker.start(lambda h: h.stop())
+        if self._scheduler.closed:
+            self._scheduler = get_scheduler(self.loop)
+        self._scheduler.schedule(self, self._on_scheduled)
 
     def _on_events(self, handle, events, err):
         z_events = self.socket.getsockopt(zmq.EVENTS)
@@ -193,32 +1017,205 @@ class ZMQ(object):
         if z_events & zmq.POLLIN:
             self._on_read()
 
-        if z_events & zmq.POLLOUT:
+        if z_events & zmq.POLLOUT and self._events & pyuv.UV_WRITABLE:
             self._on_write()
 
     def _on_read(self):
-        if not self._poll.active:
+        if not self._poll.active or not self._events & pyuv.UV_READABLE:
             return
 
-        try:
-            msg = self.socket.recv_multipart(zmq.NOBLOCK,
-                    copy=self._read_copy, track=self._read_track)
-        except zmq.ZMQError as e:
-            if e.errno == zmq.EAGAIN:
-                # state changed since poll event
-                return
-            else:
+        if self._read_executor is not None and self._read_executor.full:
+            # resumed once the executor is done with a message
+            return
+
+        if self._read_batch_cb is not None:
+            msgs = []
+        else:
+            msgs = None
+
+        if self._read_max_time is not None:
+            deadline = util.monotonic() + self._read_max_time
+        else:
+            deadline = None
+
+        stats = self._stats
+        received = 0
+        while received < self._read_batch:
+            try:
+                if self._read_pool is None:
+                    msg = self.socket.recv_multipart(zmq.NOBLOCK,
+                            copy=self._read_copy, track=self._read_track)
+                else:
+                    msg = self._recv_into(self._read_pool)
+            except zmq.ZMQError as e:
+                if e.errno == zmq.EAGAIN:
+                    # state changed since poll event or socket drained
+                    if stats is not None:
+                        stats.recv_eagain += 1
+                    break
+
                 logging.error("RECV Error: %s" % zmq.strerror(e.errno))
-                self._read_cb(self, None, e.errno)
+                if stats is not None:
+                    stats.recv_errors += 1
+                if msgs:
+                    self._read_batch_cb(self, msgs, None)
+                    msgs = None
+                self._read_error(e.errno)
+                received += 1
+                break
+
+            received += 1
+            if stats is not None:
+                stats.messages_received += 1
+                stats.bytes_received += util.msg_size(msg)
+
+            frames = msg
+            try:
+                if self._compression is not None:
+                    frames = self._compression.decompress(msg)
+                    if self._read_pool is not None and frames is not msg:
+                        self._release_replaced(msg, frames)
+                msg = frames
+                if self._read_decode:
+                    msg = self.serializer.loads(frames)
+            except Exception as e:
+                logging.error("DECODE Error: %s", e)
+                if stats is not None:
+                    stats.recv_errors += 1
+                if self._read_pool is not None:
+                    self._read_pool.release(*frames)
+                continue
+
+            if msgs is not None:
+                msgs.append(msg)
+            elif self._read_executor is not None:
+                self._read_executor.submit(self._read_cb, msg)
+                if self._read_executor.full:
+                    break
+            else:
+                if stats is None:
+                    self._read_cb(self, msg, None)
+                else:
+                    self._timed_call(self._read_cb, msg, None)
+
+                # the callback may have stopped reading or the handle
+                if (not self._events & pyuv.UV_READABLE or
+                        not self._poll.active):
+                    break
+
+            if deadline is not None and util.monotonic() >= deadline:
+                break
+
+        if msgs:
+            if stats is None:
+                self._read_batch_cb(self, msgs, None)
+            else:
+                self._timed_call(self._read_batch_cb, msgs, None)
+
+        if received:
+            # more messages may be waiting
+            self._prepare()
+
+    def _recv_into(self, pool):
+        """ receive a message in buffers of the pool """
+        socket = self.socket
+        msg = []
+        truncated = False
+        while True:
+            buf = pool.acquire()
+            try:
+                if HAS_RECV_INTO:
+                    n = socket.recv_into(buf, flags=zmq.NOBLOCK)
+                else:
+                    frame = socket.recv(zmq.NOBLOCK, copy=False)
+                    n = len(frame)
+                    if n <= len(buf):
+                        buf[:n] = frame.buffer
+            except Exception:
+                pool.release(buf, *msg)
+                raise
+
+            if n > len(buf):
+                truncated = True
+                pool.release(buf)
+            else:
+                msg.append(memoryview(buf)[:n])
+
+            if not socket.getsockopt(zmq.RCVMORE):
+                break
+
+        if truncated:
+            pool.release(*msg)
+            raise zmq.ZMQError(zmq.EMSGSIZE)
+        return msg
+
+    def _release_replaced(self, received, frames):
+        """ give back to the pool the buffers of the received frames
+        that were decompressed or dropped, like the flag frame """
+        kept = set(id(f) for f in frames)
+        self._read_pool.release(*[f for f in received if id(f) not in kept])
+
+    def _read_error(self, errno):
+        if self._read_executor is not None:
+            # the executor callback only takes messages, the error is
+            # logged and counted.
+            return
+
+        if self._read_cb is not None:
+            self._read_cb(self, None, errno)
         else:
-            self._read_cb(self, msg, None)
+            self._read_batch_cb(self, None, errno)
 
+    def _on_write(self):
+        queue = self._send_queue
+        if not queue:
+            self._events &= ~pyuv.UV_WRITABLE
+            return
+
+        blocked = False
+        while queue:
+            if not self._send():
+                # the socket is full, wait for the fd to be signaled.
+                blocked = True
+                break
+
+        if not queue:
+            self._on_drained()
+
+        if blocked and self._xpub:
+            # XPUB always reports POLLOUT, checking it again on the next
+            # iteration would retry in a busy loop.
+            self._schedule_send_retry()
+            return
+
+        self._retry_delay = SEND_RETRY_INTERVAL
+
+        # sending consumes the notifications of the fd, check the
+        # socket events again on the next iteration.
         self._prepare()
 
-    def _on_write(self):
-        try:
-            self._send()
-        except IndexError:
+    def _schedule_send_retry(self):
+        if self._send_retry is not None:
             return
 
+        delay = self._retry_delay
+        self._retry_delay = min(delay * 2, SEND_RETRY_MAX_INTERVAL)
+        self._send_retry = get_timer_wheel(self.loop).schedule(delay,
+                self._on_send_retry)
+
+    def _cancel_send_retry(self):
+        if self._send_retry is not None:
+            self._send_retry.cancel()
+            self._send_retry = None
+
+    def _on_send_retry(self):
+        self._send_retry = None
         self._prepare()
+
+    def _on_drained(self):
+        self._events &= ~pyuv.UV_WRITABLE
+
+        if self._high_water:
+            self._high_water = False
+            if self._drain_cb is not None:
+                self._drain_cb(self)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+HandleStats: counters of a :doc:`zmq`
+
+"""
+
+
+class HandleStats(object):
+    """ counters collected by a ``ZMQ`` handle once
+    :py:meth:`uzmq.sock.ZMQ.enable_stats` has been called. """
+
+    __slots__ = ('messages_received', 'bytes_received', 'messages_sent',
+            'bytes_sent', 'recv_errors', 'send_errors', 'recv_eagain',
+            'send_eagain', 'dropped', 'expired', 'queue_high_water',
+            'callbacks', 'callback_time')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ reset all the counters to 0 """
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def as_dict(self):
+        """ return the counters as a dict """
+        return dict((name, getattr(self, name)) for name in self.__slots__)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -
+#
+# This file is part of uzmq. See the NOTICE for more information.
+
+"""
+TimerWheel: many timeouts on one loop timer
+
+"""
+import logging
+import math
+
+import pyuv
+
+from . import util
+
+
+class Timeout(object):
+    """ a callback scheduled on a :py:class:`TimerWheel`, returned by
+    :py:meth:`TimerWheel.schedule`. """
+
+    __slots__ = ('wheel', 'tick', 'callback', 'args', 'active')
+
+    def __init__(self, wheel, tick, callback, args):
+        self.wheel = wheel
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.active = True
+
+    def cancel(self):
+        """ Cancel the timeout if it didn't expire yet. """
+        if self.active:
+            self.wheel._remove(self)
+
+
+class TimerWheel(object):
+    """\
+        :param loop: loop object where this wheel runs.
+        :param resolution: float
+            Duration of a tick of the wheel in seconds. Timeouts expire
+            at most one tick late.
+        :param slots: int
+            Number of slots of the wheel. Timeouts further than
+            ``slots * resolution`` seconds are kept in their slot for
+            several turns of the wheel.
+
+        A ``TimerWheel`` runs any number of timeouts with a single
+        ``pyuv.Timer``, ticking only while timeouts are pending.
+        Scheduling and cancelling a timeout take a constant time.
+
+        Callback signature: ``callback(*args)``.
+    """
+
+    def __init__(self, loop, resolution=0.01, slots=512):
+        if resolution < 0.001:
+            raise ValueError("timers don't have sub-millisecond accuracy")
+
+        self.loop = loop
+        self.resolution = resolution
+
+        # dicts keep the timeouts of a tick in the order they were scheduled
+        self._slots = [{} for i in range(slots)]
+        self._count = 0
+        self._tick = 0
+        self._start = None
+        self._timer_h = pyuv.Timer(loop)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def closed(self):
+        """*Read only*
+
+            Indicates if the wheel is closed."""
+        return self._timer_h.closed
+
+    def schedule(self, delay, callback, *args):
+        """\
+            :param delay: float, delay in seconds.
+            :param callback: callable
+
+            Call ``callback(*args)`` in ``delay`` seconds and return
+            its :py:class:`Timeout`.
+        """
+        if not util.is_callable(callback):
+            raise TypeError("a callable is required")
+
+        now = util.monotonic()
+        if not self._timer_h.active:
+            # restart where the wheel stopped
+            self._start = now - self._tick * self.resolution
+            self._timer_h.start(self._on_tick, self.resolution,
+                    self.resolution)
+
+        tick = int(math.ceil((now + delay - self._start) / self.resolution))
+        tick = max(tick, self._tick + 1)
+
+        timeout = Timeout(self, tick, callback, args)
+        self._slots[tick % len(self._slots)][timeout] = None
+        self._count += 1
+        return timeout
+
+    def close(self):
+        """ Close the wheel. Pending timeouts are cancelled. """
+        self._timer_h.close()
+        for slot in self._slots:
+            for timeout in slot:
+                timeout.active = False
+            slot.clear()
+        self._count = 0
+
+    def _remove(self, timeout):
+        timeout.active = False
+        self._slots[timeout.tick % len(self._slots)].pop(timeout, None)
+        self._count -= 1
+        if not self._count:
+            self._timer_h.stop()
+
+    def _on_tick(self, handle):
+        # catch up with the ticks missed while the loop was busy
+        target = int((util.monotonic() - self._start) / self.resolution)
+        while self._tick < target and self._count:
+            self._tick += 1
+            slot = self._slots[self._tick % len(self._slots)]
+            if not slot:
+                continue
+
+            expired = [t for t in slot if t.tick <= self._tick]
+            for timeout in expired:
+                if not timeout.active:
+                    # cancelled by a previous callback
+                    continue
+                self._remove(timeout)
+                try:
+                    timeout.callback(*timeout.args)
+                except Exception:
+                    logging.exception("TIMEOUT callback error")
+
+        if not self._count:
+            # the ticks skipped while stopped aren't replayed
+            self._tick = max(self._tick, target)
+
+
+def get_timer_wheel(loop):
+    """ return the :py:class:`TimerWheel` shared by the handles of this
+    loop. """
+    return util.loop_local(loop, 'timer_wheel', TimerWheel)
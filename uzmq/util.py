@@ -2,9 +2,15 @@
 #
 # This file is part of uzmq. See the NOTICE for more information.
 
+from collections import deque
+import logging
 import sys
+import time
 import types
 
+import pyuv
+import zmq
+
 # True if we are running on Python 3.
 PY3 = sys.version_info[0] == 3
 
@@ -26,8 +32,149 @@ else:
     text_type = unicode
     binary_type = str
 
+# clock used to measure elapsed time
+monotonic = getattr(time, 'monotonic', time.time)
+
 
 def to_bytes(s):
     if isinstance(s, binary_type):
         return s
     return s.encode('utf8')
+
+
+def to_frame(s):
+    """ encode text to bytes, any other object (bytes, buffers,
+    ``zmq.Frame``) is returned untouched. """
+    if isinstance(s, text_type):
+        return s.encode('utf8')
+    return s
+
+
+def frame_size(frame):
+    """ return the size in bytes of a frame """
+    if isinstance(frame, (binary_type, bytearray, zmq.Frame)):
+        return len(frame)
+
+    try:
+        return memoryview(frame).nbytes
+    except TypeError:
+        return len(frame)
+
+
+def frame_buffer(frame):
+    """ return the buffer of a frame, its data without copy for
+    ``zmq.Frame`` objects """
+    if isinstance(frame, zmq.Frame):
+        return frame.buffer
+    return frame
+
+
+def msg_size(msg):
+    """ return the size in bytes of a multipart message """
+    return sum(frame_size(frame) for frame in msg)
+
+
+def uv_to_zmq_events(events):
+    """ convert a mask of pyuv events to a mask of zmq events """
+    z_events = 0
+    if events & pyuv.UV_READABLE:
+        z_events |= zmq.POLLIN
+    if events & pyuv.UV_WRITABLE:
+        z_events |= zmq.POLLOUT
+    return z_events
+
+
+def zmq_to_uv_events(z_events):
+    """ convert a mask of zmq events to a mask of pyuv events """
+    events = 0
+    if z_events & zmq.POLLIN:
+        events |= pyuv.UV_READABLE
+    if z_events & zmq.POLLOUT:
+        events |= pyuv.UV_WRITABLE
+    return events
+
+
+def loop_local(loop, name, factory):
+    """ return the object registered under ``name`` for this loop,
+    creating it with ``factory(loop)`` the first time or once the
+    previous one has been closed. """
+    attr = '_uzmq_%s' % name
+    obj = getattr(loop, attr, None)
+    if obj is None or getattr(obj, 'closed', False):
+        obj = factory(loop)
+        setattr(loop, attr, obj)
+    return obj
+
+
+class CallQueue(object):
+    """ functions queued from any thread and called from the loop.
+
+    All the calls queued until the loop runs them are handled after a
+    single wakeup of the loop through a ``pyuv.Async`` handle. The
+    handle doesn't keep the loop alive unless :py:attr:`ref` is set or
+    it is held with :py:meth:`hold`. """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._calls = deque()
+        self._scheduled = False
+        self._ref = False
+        self._holds = 0
+        self._async_h = pyuv.Async(loop, self._on_async)
+        self._async_h.ref = False
+
+    @property
+    def closed(self):
+        return self._async_h.closed
+
+    @property
+    def ref(self):
+        return self._ref
+
+    @ref.setter
+    def ref(self, value):
+        self._ref = value
+        self._async_h.ref = value or self._holds > 0
+
+    def hold(self):
+        """ keep the loop alive until :py:meth:`release` is called, while
+        calls are expected from other threads. """
+        self._holds += 1
+        self._async_h.ref = True
+
+    def release(self):
+        self._holds -= 1
+        if not self._holds and not self._ref:
+            self._async_h.ref = False
+
+    def call(self, fn, *args, **kwargs):
+        """ queue ``fn(*args, **kwargs)``. Can be called from any
+        thread. """
+        self._calls.append((fn, args, kwargs))
+
+        # the flag is reset before the queue is drained, so a call
+        # queued after the last drain always sends a new wakeup.
+        if not self._scheduled:
+            self._scheduled = True
+            self._async_h.send()
+
+    def close(self):
+        self._async_h.close()
+        self._calls.clear()
+
+    def _on_async(self, handle):
+        self._scheduled = False
+
+        calls = self._calls
+        while calls:
+            fn, args, kwargs = calls.popleft()
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                logging.exception("error in a call from another thread")
+
+
+def call_queue(loop):
+    """ return the :py:class:`CallQueue` shared by the handles of this
+    loop. """
+    return loop_local(loop, 'call_queue', CallQueue)